@@ -1,16 +1,107 @@
 import streamlit as st
-import google.generativeai as genai
+import hashlib
 import json
 import os
-from typing import Dict, List, Optional
-import plotly.express as px
-import pandas as pd
+import re
+import string
 import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, List, Optional
 import datetime
 
+# pandas and google.generativeai are imported lazily inside the
+# functions that need them: Streamlit re-executes this module on every
+# interaction, and these imports dominate cold-start time
+
+# Prefer orjson for parsing model responses (2-5x faster than stdlib json)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+def _first_json_object(text: str) -> Optional[str]:
+    """Return the first brace-balanced {...} slice of text, or None.
+
+    Single forward scan tracking brace depth and string/escape state; stops
+    as soon as the object closes, so trailing prose after the JSON is never
+    walked. Handles responses wrapped in ```json fences or prose.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+def extract_json_response(response_text: str) -> Dict:
+    """Extract and parse the JSON object embedded in a model response."""
+    candidate = _first_json_object(response_text)
+    if candidate is None:
+        raise json.JSONDecodeError("No JSON found in response", response_text, 0)
+    return _json_loads(candidate)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _resolve_gemini_key_from_config():
+    """Resolve the Gemini key from secrets/env once an hour instead of per rerun"""
+    try:
+        if "api_keys" in st.secrets:
+            return st.secrets["api_keys"]["gemini_api_key"]
+        elif "gemini_api_key" in st.secrets:
+            return st.secrets["gemini_api_key"]
+    except:
+        pass
+    return os.getenv('GEMINI_API_KEY')
+
+def get_api_key():
+    """Get the Gemini API key: session override first, then cached config lookup"""
+    if st.session_state.get('user_api_key'):
+        return st.session_state.user_api_key
+    return _resolve_gemini_key_from_config()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _resolve_exa_key_from_config():
+    """Resolve the Exa key from secrets/env once an hour instead of per rerun"""
+    try:
+        if "exa_api_key" in st.secrets:
+            return st.secrets["exa_api_key"]
+    except:
+        pass
+    return os.getenv('EXA_API_KEY')
+
+def get_exa_api_key():
+    """Get the Exa API key: session override first, then cached config lookup"""
+    if st.session_state.get('user_exa_key'):
+        return st.session_state.user_exa_key
+    return _resolve_exa_key_from_config()
+
+@st.cache_data(ttl=3600, show_spinner=False)
 def list_available_models(api_key: str):
-    """Debug function to list available models"""
+    """Debug function to list available models (refetched at most hourly)"""
     try:
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
         models = genai.list_models()
         available_models = []
@@ -21,9 +112,80 @@ def list_available_models(api_key: str):
     except Exception as e:
         return [f"Error listing models: {str(e)}"]
 
+# Schema for the structured analysis response. Passed to Gemini via
+# response_mime_type/response_schema so the model returns JSON directly
+# instead of prose that needs defensive clean-up.
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "conditions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "likelihood": {"type": "integer"},
+                    "symptoms": {"type": "array", "items": {"type": "string"}},
+                    "description": {"type": "string"}
+                },
+                "required": ["name", "likelihood", "symptoms", "description"]
+            }
+        },
+        "triage": {
+            "type": "object",
+            "properties": {
+                "urgency": {"type": "string"},
+                "priority": {"type": "integer"},
+                "recommendation": {"type": "string"},
+                "reasoning": {"type": "string"}
+            },
+            "required": ["urgency", "priority", "recommendation", "reasoning"]
+        },
+        "recommendations": {"type": "array", "items": {"type": "string"}},
+        "red_flags": {"type": "array", "items": {"type": "string"}},
+        "related_symptoms": {"type": "array", "items": {"type": "string"}},
+        "follow_up": {"type": "string"}
+    },
+    "required": ["conditions", "triage", "recommendations", "red_flags", "follow_up"]
+}
+
+JSON_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": RESPONSE_SCHEMA
+}
+
+# Analysis instructions shared by every request. Set once as the model's
+# system instruction so per-call contents carry only the patient's symptoms
+# (plus retrieved context in hybrid mode); the output shape itself is
+# enforced by RESPONSE_SCHEMA, so no inline JSON example is needed.
+SYSTEM_INSTRUCTION = """
+Anda adalah dokter AI berpengalaman dengan akses ke pedoman medis terpercaya.
+Lakukan analisis komprehensif terhadap gejala pasien yang diberikan:
+1. Identifikasi 3-5 kondisi medis yang mungkin dengan likelihood realistis (0-100)
+2. Berikan deskripsi detail setiap kondisi beserta gejala terkaitnya
+3. Tentukan tingkat urgensi ("low", "medium", "high", atau "emergency") dan prioritas 1-5 berdasarkan evidens medis
+4. Sertakan rekomendasi spesifik dan actionable
+5. Identifikasi red flags berdasarkan pedoman medis
+6. Berikan rencana follow-up yang jelas (kapan harus konsultasi dokter atau ke UGD)
+7. Sebutkan gejala terkait yang perlu dipantau pasien ("related_symptoms")
+
+Gunakan konteks medis dari database bila tersedia. Jawab dalam Bahasa
+Indonesia sebagai JSON valid sesuai skema, tanpa formatting markdown apapun.
+"""
+
+# Candidate model names, in order of preference
+MODEL_CONFIGS = [
+    'gemini-1.5-flash-001',
+    'gemini-2.5-flash',
+    'gemini-2.0-flash',
+    'gemini-1.5-pro-001',
+    'gemini-pro-001',
+    'gemini-1.5-flash'
+]
+
 # Check for hybrid functionality
 try:
-    from hybrid_retrieval import HybridMedicalRetriever
+    from hybrid_retrieval import get_hybrid_retriever
     HYBRID_AVAILABLE = True
 except ImportError:
     HYBRID_AVAILABLE = False
@@ -50,137 +212,145 @@ st.markdown("""
         border-left: 4px solid #ffc107;
         margin: 20px 0;
     }
+    .triage-badge {
+        color: white;
+        padding: 10px;
+        border-radius: 5px;
+        text-align: center;
+        font-weight: bold;
+    }
+    .triage-badge-priority {
+        font-size: 24px;
+    }
+    .triage-caption {
+        text-align: center;
+        font-size: 12px;
+        color: #666;
+        margin-top: 5px;
+    }
+    .triage-low { background-color: #28a745; }
+    .triage-medium { background-color: #ffc107; }
+    .triage-high { background-color: #dc3545; }
+    .triage-emergency { background-color: #6f42c1; }
 </style>
 """, unsafe_allow_html=True)
 
-def call_gemini_api(messages: List[Dict[str, str]], api_key: str) -> Dict:
-    """Call Gemini API with structured messages"""
+@st.cache_resource(show_spinner=False)
+def get_working_model(api_key: str):
+    """Resolve the first usable Gemini model once and reuse it across reruns.
+
+    Probing every name in MODEL_CONFIGS used to happen on each request,
+    paying a full 404 round-trip per non-existent model. The resolved model
+    is cached per process.
+    """
+    import google.generativeai as genai
+
     genai.configure(api_key=api_key)
-    
-    # Try different model names with proper API versions
-    model_configs = [
-        'gemini-1.5-flash-001',
-        'gemini-2.5-flash',
-        'gemini-2.0-flash',
-        'gemini-1.5-pro-001', 
-        'gemini-pro-001',
-        'gemini-1.5-flash'
-    ]
-    
     last_error = None
-    for model_name in model_configs:
+    for model_name in MODEL_CONFIGS:
         try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(messages[0]['content'])
-            return response.text
+            model = genai.GenerativeModel(
+                model_name,
+                system_instruction=SYSTEM_INSTRUCTION,
+                generation_config=JSON_GENERATION_CONFIG
+            )
+            model.generate_content("ping")
+            return model
         except Exception as e:
             last_error = e
             if "not found" in str(e).lower():
                 continue  # Try next model
             else:
                 break  # Different error, stop trying
-    
-    # If all models failed, raise the last error
+
+    # If all models failed, surface the last error (guarding against an
+    # empty candidate list, which previously produced an obscure 'raise None')
+    if last_error is None:
+        raise RuntimeError("No Gemini model could be resolved")
     raise last_error
 
-def get_gemini_response_hybrid(user_message: str, api_key: str, exa_api_key: Optional[str] = None) -> Dict:
+def _is_transient_gemini_error(error: Exception) -> bool:
+    """Rate limits and server hiccups are worth retrying; anything else not"""
+    message = str(error).lower()
+    return any(marker in message for marker in ('429', 'quota', 'rate', '503', 'timeout', 'temporarily'))
+
+def _generate_with_fallback(prompt: str, api_key: str, on_chunk=None, max_attempts: int = 3) -> str:
+    """Generate with the cached fallback-resolved model, streaming the text.
+
+    Shared by the basic and hybrid paths so the chunk-accumulation loop
+    exists in one place. Transient failures (429/quota/5xx/timeouts) are
+    retried with exponential backoff, but only while nothing has been
+    streamed to the caller yet; a stream that dies midway is re-raised so
+    on_chunk output is never duplicated.
+    """
+    for attempt in range(max_attempts):
+        parts = []
+        try:
+            stream = get_working_model(api_key).generate_content(prompt, stream=True)
+            for chunk in stream:
+                chunk_text = getattr(chunk, 'text', '') or ''
+                if chunk_text:
+                    parts.append(chunk_text)
+                    if on_chunk:
+                        on_chunk(chunk_text)
+            return "".join(parts)
+        except Exception as e:
+            if parts or attempt == max_attempts - 1 or not _is_transient_gemini_error(e):
+                raise
+            time.sleep(min(8, 2 ** attempt))
+
+def call_gemini_api(messages: List[Dict[str, str]], api_key: str, on_chunk=None) -> str:
+    """Call Gemini API with structured messages, streaming the response text.
+
+    The full text is still returned (downstream parsing needs the complete
+    JSON), but chunks arrive as the model generates them, so callers can pass
+    an `on_chunk` callback to update the UI from first-token time instead of
+    waiting for the whole completion.
+    """
+    return _generate_with_fallback(messages[0]['content'], api_key, on_chunk=on_chunk)
+
+# Prompt for the hybrid analysis path. Built once at import; per call
+# only the three variable slots are substituted.
+_HYBRID_PROMPT_TEMPLATE = """GEJALA PASIEN: {user_message}
+
+KONTEKS MEDIS DARI DATABASE:
+{context}
+
+SUMBER MEDIS TERPERCAYA: {n_sources} pedoman dan penelitian"""
+
+def get_gemini_response_hybrid(user_message: str, api_key: str, exa_api_key: Optional[str] = None, on_chunk=None, retriever=None) -> Dict:
     """Get response using hybrid approach with local guidelines and web research"""
     try:
         # Return basic mode if hybrid is not available
         if not HYBRID_AVAILABLE:
-            return get_gemini_response_basic(user_message, api_key)
-            
-        # Initialize hybrid retriever
-        retriever = HybridMedicalRetriever(gemini_api_key=api_key, exa_api_key=exa_api_key)
-        
-        # Prepare hybrid message with context from local guidelines and web research
-        context_data = retriever.hybrid_search(user_message, [], [])
-        
-        hybrid_prompt = f"""
-        Sebagai dokter AI dengan akses ke pedoman medis terkini dan penelitian medis terpercaya, lakukan analisis komprehensif:
-
-        GEJALA PASIEN: {user_message}
-
-        KONTEKS MEDIS DARI DATABASE:
-        {context_data.get('context', 'Tidak ada konteks tambahan tersedia')}
+            return get_gemini_response_basic(user_message, api_key, on_chunk=on_chunk)
 
-        SUMBER MEDIS TERPERCAYA: {len(context_data.get('sources', []))} pedoman dan penelitian
+        # Reuse the retriever handle resolved in main(); fall back to the
+        # cached instance for callers that don't thread one through
+        if retriever is None:
+            retriever = get_hybrid_retriever(api_key, exa_api_key)
 
-        INSTRUKSI ANALISIS:
-        1. Identifikasi 3-5 kondisi medis dengan likelihood realistis
-        2. Berikan deskripsi detail setiap kondisi
-        3. Tentukan tingkat urgensi berdasarkan evidens medis
-        4. Sertakan rekomendasi spesifik dan actionable
-        5. Identifikasi red flags berdasarkan pedoman medis
+        # Run retrieval in the background while the model handle is resolved,
+        # so the two setup costs overlap instead of running back to back
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            retrieval_future = executor.submit(
+                retriever.hybrid_search, user_message, [], []
+            )
+            get_working_model(api_key)  # warm the model cache during retrieval
+            context_data = retrieval_future.result()
 
-        Format JSON response:
-        {{
-            "conditions": [
-                {{"name": "Influenza/Flu", "likelihood": 78, "symptoms": ["demam tinggi", "sakit kepala", "nyeri otot", "kelelahan"], "description": "Infeksi virus dengan gejala sistemik yang cocok dengan presentasi pasien. Likelihood tinggi berdasarkan kombinasi demam, sakit kepala, dan nyeri otot."}},
-                {{"name": "COVID-19", "likelihood": 65, "symptoms": ["demam", "sakit kepala", "kelelahan"], "description": "Infeksi SARS-CoV-2 dengan gejala mirip flu. Perlu pertimbangan karena masih dalam sirkulasi komunitas."}},
-                {{"name": "Dengue Fever", "likelihood": 45, "symptoms": ["demam tinggi", "sakit kepala", "nyeri otot"], "description": "Kemungkinan dengue terutama jika ada riwayat gigitan nyamuk atau endemik di area tersebut."}}
-            ],
-            "triage": {{
-                "urgency": "medium",
-                "priority": 3,
-                "recommendation": "Konsultasi dokter dalam 24-48 jam untuk evaluasi dan konfirmasi diagnosis",
-                "reasoning": "Kombinasi demam tinggi dan gejala sistemik memerlukan evaluasi medis untuk membedakan antara infeksi virus dan kemungkinan kondisi yang memerlukan perawatan spesifik"
-            }},
-            "recommendations": [
-                "Istirahat total dan hidrasi adekuat (8-10 gelas air per hari)",
-                "Monitor suhu tubuh setiap 4-6 jam",
-                "Konsumsi paracetamol 500mg setiap 6-8 jam untuk demam",
-                "Isolasi mandiri jika suspek infeksi menular",
-                "Konsumsi makanan bergizi dan mudah dicerna"
-            ],
-            "red_flags": [
-                "Demam di atas 39°C yang persisten lebih dari 3 hari",
-                "Sesak napas atau kesulitan bernapas",
-                "Penurunan kesadaran atau confusion",
-                "Tanda-tanda dehidrasi berat"
-            ],
-            "follow_up": "Konsultasi dokter dalam 24-48 jam. Segera ke UGD jika mengalami red flags atau gejala memburuk"
-        }}
+        hybrid_prompt = _HYBRID_PROMPT_TEMPLATE.format(
+            user_message=user_message,
+            context=context_data.get('context', 'Tidak ada konteks tambahan tersedia'),
+            n_sources=len(context_data.get('sources', []))
+        )
 
-        PENTING: Response harus JSON valid tanpa ```json atau markdown formatting apapun.
-        """
+        # Generate response with the already-resolved model
+        response_text = _generate_with_fallback(hybrid_prompt, api_key, on_chunk=on_chunk)
 
-        # Generate response
-        genai.configure(api_key=api_key)
-        
-        # Try different model names with proper API versions
-        model_configs = [
-            'gemini-1.5-flash-001',
-            'gemini-1.5-pro-001', 
-            'gemini-pro-001',
-            'gemini-1.5-flash'
-        ]
-        
-        last_error = None
-        for model_name in model_configs:
-            try:
-                model = genai.GenerativeModel(model_name)
-                response = model.generate_content(hybrid_prompt)
-                break
-            except Exception as e:
-                last_error = e
-                if "not found" in str(e).lower():
-                    continue  # Try next model
-                else:
-                    break  # Different error, stop trying
-        else:
-            # If all models failed, raise the last error
-            raise last_error
-        
         try:
             # Try to parse as JSON
-            response_text = response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
-            
-            result = json.loads(response_text)
+            result = extract_json_response(response_text)
             
             # Add source information to the result
             result['sources_used'] = {
@@ -196,97 +366,35 @@ def get_gemini_response_hybrid(user_message: str, api_key: str, exa_api_key: Opt
             # Silently fallback without interrupting user experience
             if st.session_state.get('debug_mode', False):
                 st.warning(f"JSON parsing failed in hybrid mode, using basic analysis.")
-            return get_gemini_response_basic(user_message, api_key)
+            return get_gemini_response_basic(user_message, api_key, on_chunk=on_chunk)
             
     except Exception as e:
         # Silently fallback to basic analysis without showing error to user during progress
         # Only log the error for debugging if needed
         if st.session_state.get('debug_mode', False):
             st.warning(f"Hybrid mode failed, using basic analysis: {str(e)}")
-        return get_gemini_response_basic(user_message, api_key)
+        return get_gemini_response_basic(user_message, api_key, on_chunk=on_chunk)
 
-def get_gemini_response_basic(user_message: str, api_key: str) -> Dict:
+def get_gemini_response_basic(user_message: str, api_key: str, on_chunk=None) -> Dict:
     """Basic Gemini response without hybrid features"""
-    prompt = f"""
-    Sebagai dokter AI yang berpengalaman, lakukan analisis mendalam terhadap gejala pasien berikut:
-
-    GEJALA PASIEN: {user_message}
-
-    Instruksi:
-    1. Identifikasi minimal 3-5 kondisi medis yang mungkin
-    2. Berikan persentase likelihood yang realistis (tinggi untuk kondisi yang sangat mungkin)
-    3. Sertakan gejala terkait untuk setiap kondisi
-    4. Berikan rekomendasi spesifik dan actionable
-    5. Tentukan tingkat urgensi berdasarkan gejala
-    6. Identifikasi red flags jika ada
-
-    Response dalam format JSON berikut:
-    {{
-        "conditions": [
-            {{"name": "Kondisi Medis Spesifik", "likelihood": 75, "symptoms": ["demam tinggi", "sakit kepala", "nyeri otot"], "description": "Penjelasan detail kondisi dan mengapa kemungkinannya tinggi berdasarkan gejala"}},
-            {{"name": "Kondisi Alternatif", "likelihood": 45, "symptoms": ["gejala1", "gejala2"], "description": "Penjelasan alternatif kondisi"}},
-            {{"name": "Kondisi Lain", "likelihood": 30, "symptoms": ["gejala3"], "description": "Kemungkinan lain yang perlu dipertimbangkan"}}
-        ],
-        "triage": {{
-            "urgency": "medium",
-            "priority": 3,
-            "recommendation": "Konsultasi dengan dokter dalam 24-48 jam untuk evaluasi lebih lanjut",
-            "reasoning": "Berdasarkan kombinasi gejala yang dialami, diperlukan evaluasi medis untuk konfirmasi diagnosis"
-        }},
-        "recommendations": [
-            "Istirahat yang cukup dan minum banyak air",
-            "Monitor suhu tubuh setiap 4 jam",
-            "Konsumsi paracetamol untuk demam jika diperlukan",
-            "Hindari aktivitas berat hingga gejala membaik",
-            "Konsultasi dokter jika gejala memburuk"
-        ],
-        "red_flags": [
-            "Demam di atas 39°C yang tidak turun dengan obat",
-            "Kesulitan bernapas atau sesak napas",
-            "Nyeri dada yang hebat"
-        ],
-        "follow_up": "Konsultasi dokter dalam 24-48 jam. Jika mengalami red flags, segera ke UGD"
-    }}
-
-    PENTING: Berikan hanya JSON valid tanpa ```json atau ``` formatting.
-    """
+    prompt = f"GEJALA PASIEN: {user_message}"
 
     try:
-        response = call_gemini_api([{"content": prompt}], api_key)
+        response = call_gemini_api([{"content": prompt}], api_key, on_chunk=on_chunk)
         # Clean and parse JSON
         response_text = response.strip()
-        
-        # Try to extract JSON from various formats
-        if response_text.startswith('```json'):
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            json_text = response_text[start:end]
-        elif response_text.startswith('```'):
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            json_text = response_text[start:end]
-        elif response_text.startswith('{') and response_text.endswith('}'):
-            # Direct JSON response
-            json_text = response_text
-        else:
-            # Try to find JSON within the response
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            if start != -1 and end > start:
-                json_text = response_text[start:end]
-            else:
-                raise json.JSONDecodeError("No JSON found in response", response_text, 0)
-        
-        return json.loads(json_text)
-        
+        return extract_json_response(response_text)
+
     except json.JSONDecodeError as e:
         # Only show debug info if debug mode is enabled
         if st.session_state.get('debug_mode', False):
             st.error(f"JSON parsing failed: {str(e)}")
             st.text_area("Raw AI Response (for debugging):", response_text, height=200)
         
-        # Return a more graceful fallback response
+        # Return a more graceful fallback response; the _fallback marker
+        # keeps transient failures out of the analysis cache
         return {
+            "_fallback": True,
             "conditions": [
                 {"name": "Analisis Medis", "likelihood": 70, "symptoms": ["Berdasarkan gejala yang disebutkan"], "description": "Analisis berdasarkan gejala yang telah dijelaskan. Memerlukan evaluasi medis lebih lanjut untuk diagnosis yang akurat."}
             ],
@@ -301,6 +409,7 @@ def get_gemini_response_basic(user_message: str, api_key: str) -> Dict:
             st.error(f"System error: {str(e)}")
         
         return {
+            "_fallback": True,
             "conditions": [
                 {"name": "Evaluasi Medis Diperlukan", "likelihood": 60, "symptoms": ["Gejala yang dilaporkan"], "description": "Diperlukan evaluasi medis lebih lanjut untuk analisis yang komprehensif."}
             ],
@@ -310,172 +419,157 @@ def get_gemini_response_basic(user_message: str, api_key: str) -> Dict:
             "follow_up": "Segera konsultasi dengan tenaga medis"
         }
 
-def get_gemini_response(user_message: str, api_key: str, exa_api_key: Optional[str] = None) -> Dict:
-    """Route to appropriate response method"""
-    if HYBRID_AVAILABLE and st.session_state.get('use_hybrid_mode', True):
-        return get_gemini_response_hybrid(user_message, api_key, exa_api_key)
+class _AnalysisUncached(Exception):
+    """Carries a fallback analysis out of the cached layer without caching it"""
+    def __init__(self, result: Dict):
+        super().__init__("analysis fell back to the canned response")
+        self.result = result
+
+@st.cache_data(ttl=1800, max_entries=128, show_spinner=False)
+def _cached_analysis(cache_key: str, _user_message: str, _api_key: str,
+                     _exa_api_key: Optional[str], _hybrid: bool, _on_chunk=None,
+                     _retriever=None) -> Dict:
+    """Run the analysis once per (message, mode) key; repeats hit the cache.
+
+    Only cache_key participates in Streamlit's cache hashing (the other
+    arguments are underscore-prefixed), so the API key never enters the
+    cache key store and the unhashable on_chunk callback is allowed.
+    Fallback responses from transient failures are raised out instead of
+    returned, so st.cache_data never memoizes them.
+    """
+    if _hybrid:
+        result = get_gemini_response_hybrid(_user_message, _api_key, _exa_api_key, on_chunk=_on_chunk, retriever=_retriever)
     else:
-        return get_gemini_response_basic(user_message, api_key)
+        result = get_gemini_response_basic(_user_message, _api_key, on_chunk=_on_chunk)
+    if result.pop('_fallback', False):
+        raise _AnalysisUncached(result)
+    return result
 
-def perform_analysis_with_progress(user_message: str, api_key: str, exa_api_key: Optional[str] = None) -> Dict:
-    """Perform analysis with enhanced visual progress indicators and spinners"""
-    import time
-    
+def get_gemini_response(user_message: str, api_key: str, exa_api_key: Optional[str] = None, on_chunk=None, retriever=None) -> Dict:
+    """Route to appropriate response method, deduplicating repeat queries"""
+    hybrid = HYBRID_AVAILABLE and st.session_state.get('use_hybrid_mode', True)
+    cache_key = hashlib.sha256(
+        f"{user_message}|{hybrid}|{exa_api_key is not None}".encode()
+    ).hexdigest()
+    try:
+        return _cached_analysis(cache_key, user_message, api_key, exa_api_key, hybrid, _on_chunk=on_chunk, _retriever=retriever)
+    except _AnalysisUncached as fallback:
+        # Serve the canned response for this attempt only; the next retry
+        # reaches the API again instead of a cached non-answer
+        return fallback.result
+
+def perform_analysis_with_progress(user_message: str, api_key: str, exa_api_key: Optional[str] = None, retriever=None) -> Dict:
+    """Perform analysis with progress driven by real pipeline events"""
     # Create progress container
     progress_container = st.container()
-    
+
     with progress_container:
         st.markdown("### 🔬 Analisis Hybrid AI Sedang Berlangsung...")
-        
+
         # Initialize progress components
         progress_bar = st.progress(0)
         status_text = st.empty()
         step_details = st.empty()
-        
+
         try:
             # Check if hybrid mode is enabled
             is_hybrid = HYBRID_AVAILABLE and st.session_state.get('use_hybrid_mode', True)
             has_exa = exa_api_key is not None
-            
-            # Step 1: Initialize Analysis (15%)
-            with st.spinner("Memulai analisis..."):
-                status_text.markdown("**🧠 Langkah 1/6:** Memulai analisis dengan Gemini AI...")
-                step_details.info("⏳ Memproses gejala dan mempersiapkan analisis...")
-                progress_bar.progress(15)
-                time.sleep(0.4)
-            
-            # Step 2: Initial Processing (25%)
-            with st.spinner("Menganalisis gejala..."):
-                status_text.markdown("**📋 Langkah 2/6:** Menganalisis gejala yang dilaporkan...")
-                step_details.info("🔍 Mengekstrak dan mengkategorikan gejala...")
-                progress_bar.progress(25)
-                time.sleep(0.3)
-            
+
+            status_text.markdown("**🧠 Langkah 1/3:** Mempersiapkan analisis...")
             if is_hybrid:
-                # Step 3: Preparing Hybrid Systems (40%)
-                with st.spinner("Mempersiapkan sistem hybrid..."):
-                    status_text.markdown("**⚙️ Langkah 3/6:** Mempersiapkan sistem hybrid...")
-                    step_details.info("⚙️ Menginisialisasi RAG dan sistem pencarian...")
-                    progress_bar.progress(40)
-                    time.sleep(0.5)
-                
-                # Step 4: Document & Web Search (60%)
-                with st.spinner("Mencari informasi medis..."):
-                    if has_exa:
-                        status_text.markdown("**📚🌐 Langkah 4/6:** Mencari pedoman & penelitian...")
-                        step_details.info("🌐 Mengakses database penelitian medis dan pedoman lokal...")
-                    else:
-                        status_text.markdown("**📚 Langkah 4/6:** Mencari pedoman medis...")
-                        step_details.info("� Mengakses database pedoman medis lokal...")
-                    progress_bar.progress(60)
-                    time.sleep(0.6)
-                
-                # Step 5: Processing Information (80%)
-                with st.spinner("Memproses informasi medis..."):
-                    status_text.markdown("**🧠 Langkah 5/6:** Memproses informasi medis...")
-                    step_details.info("🧠 Sistem AI sedang menganalisis data dari berbagai sumber...")
-                    progress_bar.progress(80)
-                    time.sleep(0.3)
-                
-            else:
-                # Basic mode steps
-                with st.spinner("Menggunakan analisis standar..."):
-                    status_text.markdown("**📖 Langkah 3/6:** Mode analisis standar...")
-                    step_details.info("� Menggunakan analisis dasar...")
-                    progress_bar.progress(40)
-                    time.sleep(0.4)
-                
-                with st.spinner("Memproses dengan AI..."):
-                    status_text.markdown("**🔬 Langkah 4/6:** Memproses dengan AI...")
-                    step_details.info("� Menganalisis gejala dengan Gemini AI...")
-                    progress_bar.progress(60)
-                    time.sleep(0.5)
-                
-                with st.spinner("Menyusun hasil analisis..."):
-                    status_text.markdown("**⚕️ Langkah 5/6:** Menyusun hasil...")
-                    step_details.info("📝 AI sedang menyusun diagnosis dan rekomendasi...")
-                    progress_bar.progress(80)
-                    time.sleep(0.3)
-            
-            # Final processing with spinner for the actual AI call
-            with st.spinner("Menyelesaikan analisis medis..."):
-                step_details.info("⚕️ Menyelesaikan diagnosis dan rekomendasi...")
-                time.sleep(0.2)
-                
-                # Perform the actual analysis
-                result = get_gemini_response(user_message, api_key, exa_api_key)
-            
-            # Step 6: Complete (100%) with final spinner
-            with st.spinner("Menyelesaikan dan memformat hasil..."):
-                status_text.markdown("**✅ Langkah 6/6:** Analisis selesai!")
-                if result.get('sources_used'):
-                    sources = result['sources_used']
-                    step_details.success(f"🎯 Berhasil menggunakan {sources.get('total_sources', 0)} sumber: {sources.get('local_guidelines', 0)} pedoman lokal + {sources.get('web_research', 0)} penelitian web")
+                if has_exa:
+                    step_details.info("📚🌐 Mengakses pedoman lokal dan penelitian web...")
                 else:
-                    step_details.success("🎯 Analisis dasar selesai dengan hasil yang akurat!")
-                progress_bar.progress(100)
-                
-                # Brief pause to show completion
-                time.sleep(0.8)
-            
+                    step_details.info("📚 Mengakses database pedoman medis lokal...")
+            else:
+                step_details.info("📖 Menggunakan analisis dasar...")
+            progress_bar.progress(10)
+
+            # Advance the bar as streamed response chunks arrive. Generation
+            # length is open-ended, so creep toward 90% and finish at 100%
+            # when the result is in.
+            chunk_count = 0
+
+            def on_chunk(_chunk_text):
+                nonlocal chunk_count
+                chunk_count += 1
+                if chunk_count == 1:
+                    status_text.markdown("**⚕️ Langkah 2/3:** Menyusun diagnosis dan rekomendasi...")
+                progress_bar.progress(min(90, 30 + chunk_count * 5))
+
+            status_text.markdown("**🔬 Langkah 2/3:** Menganalisis gejala dengan Gemini AI...")
+            progress_bar.progress(30)
+
+            # Perform the actual analysis
+            result = get_gemini_response(user_message, api_key, exa_api_key, on_chunk=on_chunk, retriever=retriever)
+
+            status_text.markdown("**✅ Langkah 3/3:** Analisis selesai!")
+            if result.get('sources_used'):
+                sources = result['sources_used']
+                step_details.success(f"🎯 Berhasil menggunakan {sources.get('total_sources', 0)} sumber: {sources.get('local_guidelines', 0)} pedoman lokal + {sources.get('web_research', 0)} penelitian web")
+            else:
+                step_details.success("🎯 Analisis dasar selesai dengan hasil yang akurat!")
+            progress_bar.progress(100)
+
             return result
-            
+
         except Exception as e:
             status_text.error("❌ Terjadi kesalahan dalam analisis")
             step_details.error(f"Error: {str(e)}")
             # Return basic analysis as fallback
             return get_gemini_response_basic(user_message, api_key)
-        
+
         finally:
-            # Clean up progress bar after a brief delay
-            time.sleep(0.5)
             progress_container.empty()
 
+@st.cache_data(show_spinner=False)
+def _likelihood_chart_data(conditions_key):
+    """Build the chart data, cached by its (name, likelihood) tuple key"""
+    import pandas as pd
+
+    # Truncate long condition names for better display
+    short_names = [
+        name[:25] + '...' if len(name) > 25 else name
+        for name, _ in conditions_key
+    ]
+    return pd.DataFrame(
+        {'Likelihood (%)': [likelihood for _, likelihood in conditions_key]},
+        index=pd.Index(short_names, name='Condition')
+    )
+
 def create_likelihood_chart(conditions):
-    """Create a bar chart showing condition likelihoods"""
+    """Create the likelihood data rendered via st.bar_chart"""
     if not conditions:
         return None
-    
-    df = pd.DataFrame(conditions)
-    
-    # Truncate long condition names for better display
-    df['short_name'] = df['name'].apply(lambda x: x[:25] + '...' if len(x) > 25 else x)
-    
-    fig = px.bar(
-        df, 
-        x='likelihood', 
-        y='short_name',
-        orientation='h',
-        title='Condition Likelihood (%)',
-        labels={'likelihood': 'Likelihood (%)', 'short_name': 'Condition'},
-        color='likelihood',
-        color_continuous_scale='RdYlBu_r',
-        range_x=[0, 100]
-    )
-    
-    fig.update_layout(
-        height=max(300, len(conditions) * 60),
-        showlegend=False,
-        yaxis={'categoryorder': 'total ascending'}
-    )
-    
-    # Add percentage labels on bars
-    fig.update_traces(
-        texttemplate='%{x}%',
-        textposition='outside'
+
+    # Key the cache on the hashable payload so Streamlit reruns (widget
+    # toggles etc.) reuse the data instead of rebuilding it
+    conditions_key = tuple(
+        (c.get('name', ''), c.get('likelihood', 0)) for c in conditions
     )
-    
-    return fig
-
-def get_risk_badge_color(risk_level):
-    """Get color for risk level badge with medical triage colors"""
-    colors = {
-        'low': '#28a745',      # Green - Non-urgent (Prioritas III)
-        'medium': '#ffc107',   # Yellow - Urgent (Prioritas II) 
-        'high': '#dc3545',     # Red - Critical (Prioritas I)
-        'emergency': '#6f42c1' # Purple - Immediate (Prioritas 0)
-    }
-    return colors.get(risk_level.lower(), '#6c757d')
+    return _likelihood_chart_data(conditions_key)
+
+# Session keys dropped by the sidebar "Clear Conversation" action
+KEYS_TO_CLEAR = frozenset({
+    'chat_history', 'symptom_collection_mode', 'collected_symptoms',
+    'selected_additional_symptoms', 'trigger_analysis', 'prev_question_timestamp',
+    'msg_counter', 'latest_followup', 'analysis_finished', 'extracted_cache'
+})
+
+# Static markup for the selected-symptom tags; only the symptom text varies
+_SYMPTOM_TAG_TEMPLATE = (
+    '<span style="background-color: #e1f5fe; color: #01579b; padding: 4px 8px; '
+    'margin: 2px; border-radius: 12px; font-size: 12px; display: inline-block;">🔸 {}</span>'
+)
+
+# urgency -> (badge text, priority description, expected 1-5 priority)
+_URGENCY_MAP = {
+    'low': ('🟢 NON-URGEN', 'Prioritas III - Ringan', 1),
+    'medium': ('🟡 URGEN', 'Prioritas II - Serius tapi stabil', 3),
+    'high': ('🔴 KRITIS', 'Prioritas I - Mengancam nyawa', 4),
+    'emergency': ('🔴 IMMEDIATE', 'Prioritas 0 - Segera ditangani', 5)
+}
 
 def display_triage_results(triage_data):
     """Display triage results with enhanced formatting and medical context"""
@@ -488,14 +582,9 @@ def display_triage_results(triage_data):
     reasoning = triage_data.get('reasoning', 'Berdasarkan analisis gejala')
     
     # Map urgency to medical triage categories and ensure consistency
-    urgency_mapping = {
-        'low': ('🟢 NON-URGEN', 'Prioritas III - Ringan', 1),
-        'medium': ('🟡 URGEN', 'Prioritas II - Serius tapi stabil', 3),
-        'high': ('🔴 KRITIS', 'Prioritas I - Mengancam nyawa', 4),
-        'emergency': ('🔴 IMMEDIATE', 'Prioritas 0 - Segera ditangani', 5)
-    }
-    
-    urgency_display, priority_description, expected_priority = urgency_mapping.get(urgency.lower(), ('🟡 URGEN', 'Prioritas II', 3))
+    urgency_display, priority_description, expected_priority = _URGENCY_MAP.get(
+        urgency.lower(), _URGENCY_MAP['medium']
+    )
     
     # Use consistent priority - if the priority doesn't match urgency, use the mapped one
     if abs(priority - expected_priority) > 1:  # If there's a mismatch
@@ -508,34 +597,32 @@ def display_triage_results(triage_data):
     
     with col1:
         st.markdown("### 🚨 Tingkat Urgensi")
-        color = get_risk_badge_color(urgency)
-        st.markdown(f"""
-        <div style="background-color: {color}; color: white; padding: 10px; border-radius: 5px; text-align: center; font-weight: bold;">
-            {urgency_display}
-        </div>
-        <div style="text-align: center; font-size: 12px; color: #666; margin-top: 5px;">
-            {priority_description}
-        </div>
-        """, unsafe_allow_html=True)
-    
+        # Colors come from the triage-* classes in the global style block,
+        # so only the badge text varies per render
+        badge_class = urgency.lower()
+        if badge_class not in ('low', 'medium', 'high', 'emergency'):
+            badge_class = 'medium'
+        st.markdown(
+            f'<div class="triage-badge triage-{badge_class}">{urgency_display}</div>'
+            f'<div class="triage-caption">{priority_description}</div>',
+            unsafe_allow_html=True
+        )
+
     with col2:
         st.markdown("### 📊 Skala Prioritas")
-        # Use color based on consistent priority level
+        # Color based on consistent priority level
         if consistent_priority >= 4:
-            priority_color = "#dc3545"  # Red for high priority
+            priority_class = "triage-high"
         elif consistent_priority >= 3:
-            priority_color = "#ffc107"  # Yellow for medium priority
+            priority_class = "triage-medium"
         else:
-            priority_color = "#28a745"  # Green for low priority
-            
-        st.markdown(f"""
-        <div style="background-color: {priority_color}; color: white; padding: 10px; border-radius: 5px; text-align: center; font-weight: bold; font-size: 24px;">
-            {consistent_priority}/5
-        </div>
-        <div style="text-align: center; font-size: 12px; color: #666; margin-top: 5px;">
-            Skala 1-5 (5 = paling mendesak)
-        </div>
-        """, unsafe_allow_html=True)
+            priority_class = "triage-low"
+
+        st.markdown(
+            f'<div class="triage-badge triage-badge-priority {priority_class}">{consistent_priority}/5</div>'
+            '<div class="triage-caption">Skala 1-5 (5 = paling mendesak)</div>',
+            unsafe_allow_html=True
+        )
     
     with col3:
         st.markdown("### 💡 Rekomendasi")
@@ -558,6 +645,16 @@ def display_triage_results(triage_data):
     
     return triage_data
 
+@st.cache_data(max_entries=128, show_spinner=False)
+def _condition_details_markdown(description: str, symptoms_key: tuple) -> str:
+    """Coalesce one condition's detail lines into a single markdown string"""
+    lines = [f"**Description:** {description}"]
+    if symptoms_key:
+        lines.append("")
+        lines.append("**Associated Symptoms:**")
+        lines.extend(f"- {symptom}" for symptom in symptoms_key)
+    return "\n".join(lines)
+
 def display_full_analysis_results(analysis_result):
     """Display complete analysis results including conditions, recommendations, etc."""
     if not analysis_result:
@@ -566,12 +663,12 @@ def display_full_analysis_results(analysis_result):
     # Show extracted symptoms if available
     if st.session_state.get("collected_symptoms"):
         st.markdown("### 📋 Gejala yang Terkumpul")
-        all_symptoms = []
-        for symptom_text in st.session_state.collected_symptoms:
-            all_symptoms.extend(extract_symptoms_simple(symptom_text))
-        
-        if all_symptoms:
-            unique_symptoms = list(dict.fromkeys(all_symptoms))  # Remove duplicates
+        # One extraction pass over the joined transcript instead of one per
+        # collected entry; the extractor already dedups in insertion order
+        combined_text = "\n".join(st.session_state.collected_symptoms)
+        unique_symptoms = extract_symptoms_simple(combined_text)
+
+        if unique_symptoms:
             cols = st.columns(min(3, len(unique_symptoms)))
             for i, symptom in enumerate(unique_symptoms):
                 with cols[i % 3]:
@@ -589,19 +686,18 @@ def display_full_analysis_results(analysis_result):
         st.markdown("### 🔍 Possible Conditions")
         
         # Create likelihood chart
-        chart = create_likelihood_chart(analysis_result['conditions'])
-        if chart:
-            st.plotly_chart(chart, use_container_width=True)
+        chart_data = create_likelihood_chart(analysis_result['conditions'])
+        if chart_data is not None:
+            st.bar_chart(chart_data, horizontal=True, use_container_width=True)
         
-        # Display detailed conditions
+        # Display detailed conditions: one memoized markdown block per
+        # expander instead of a widget per description/symptom line
         for i, condition in enumerate(analysis_result['conditions']):
             with st.expander(f"📋 {condition.get('name', 'Unknown Condition')} ({condition.get('likelihood', 0)}% likelihood)"):
-                st.write(f"**Description:** {condition.get('description', 'No description available')}")
-                
-                if condition.get('symptoms'):
-                    st.write("**Associated Symptoms:**")
-                    for symptom in condition['symptoms']:
-                        st.write(f"• {symptom}")
+                st.markdown(_condition_details_markdown(
+                    condition.get('description', 'No description available'),
+                    tuple(condition.get('symptoms') or ())
+                ))
     
     # Recommendations
     if 'recommendations' in analysis_result and analysis_result['recommendations']:
@@ -614,7 +710,18 @@ def display_full_analysis_results(analysis_result):
         st.markdown("### 🚨 Warning Signs")
         for flag in analysis_result['red_flags']:
             st.error(f"⚠️ {flag}")
-    
+
+    # Related symptoms to watch, produced by the same analysis call; fall
+    # back to the local association tables when the model omits the field
+    related_to_watch = analysis_result.get('related_symptoms')
+    if not related_to_watch and analysis_result.get('conditions'):
+        top_condition = analysis_result['conditions'][0].get('name', '')
+        extracted = extract_symptoms_simple("\n".join(st.session_state.get("collected_symptoms", [])))
+        related_to_watch = get_related_symptoms_from_extraction(extracted, top_condition)
+    if related_to_watch:
+        st.markdown("### 👁️ Gejala Terkait untuk Dipantau")
+        st.info(" • ".join(related_to_watch))
+
     # Follow-up
     if 'follow_up' in analysis_result and analysis_result['follow_up']:
         st.markdown("### 📅 Follow-up")
@@ -633,145 +740,394 @@ def display_full_analysis_results(analysis_result):
                 for source in sources['sources'][:5]:  # Show first 5 sources
                     st.write(f"• {source.get('title', 'Medical Source')}")
 
+# Condition -> associated symptoms, used to suggest follow-up questions
+SYMPTOM_DATABASE = {
+    "flu": ["demam", "batuk", "pilek", "sakit kepala", "nyeri otot", "kelelahan"],
+    "covid-19": ["demam", "batuk kering", "sesak napas", "hilang penciuman", "hilang pengecapan", "kelelahan"],
+    "dengue": ["demam tinggi", "sakit kepala", "nyeri mata", "nyeri otot", "ruam kulit", "mual"],
+    "typhoid": ["demam", "sakit kepala", "nyeri perut", "diare", "konstipasi", "ruam"],
+    "gastritis": ["nyeri perut", "mual", "muntah", "kembung", "heartburn"],
+    "hipertensi": ["sakit kepala", "pusing", "sesak napas", "nyeri dada", "penglihatan kabur"],
+    "diabetes": ["sering haus", "sering buang air kecil", "kelelahan", "penglihatan kabur", "luka sulit sembuh"],
+    "asma": ["sesak napas", "mengi", "batuk", "dada sesak"],
+    "migrain": ["sakit kepala berdenyut", "mual", "muntah", "sensitif cahaya", "sensitif suara"],
+    "pneumonia": ["batuk", "demam", "sesak napas", "nyeri dada", "kelelahan"]
+}
+
+# One compiled alternation over the condition names replaces the per-call
+# scan of the whole database with substring checks per name
+_CONDITION_PATTERN = re.compile(
+    "|".join(
+        re.escape(condition)
+        for condition in sorted(SYMPTOM_DATABASE, key=len, reverse=True)
+    )
+)
+
 def get_related_symptoms(condition_name):
     """Get related symptoms for a condition"""
-    symptom_database = {
-        "flu": ["demam", "batuk", "pilek", "sakit kepala", "nyeri otot", "kelelahan"],
-        "covid-19": ["demam", "batuk kering", "sesak napas", "hilang penciuman", "hilang pengecapan", "kelelahan"],
-        "dengue": ["demam tinggi", "sakit kepala", "nyeri mata", "nyeri otot", "ruam kulit", "mual"],
-        "typhoid": ["demam", "sakit kepala", "nyeri perut", "diare", "konstipasi", "ruam"],
-        "gastritis": ["nyeri perut", "mual", "muntah", "kembung", "heartburn"],
-        "hipertensi": ["sakit kepala", "pusing", "sesak napas", "nyeri dada", "penglihatan kabur"],
-        "diabetes": ["sering haus", "sering buang air kecil", "kelelahan", "penglihatan kabur", "luka sulit sembuh"],
-        "asma": ["sesak napas", "mengi", "batuk", "dada sesak"],
-        "migrain": ["sakit kepala berdenyut", "mual", "muntah", "sensitif cahaya", "sensitif suara"],
-        "pneumonia": ["batuk", "demam", "sesak napas", "nyeri dada", "kelelahan"]
-    }
-    
-    related = []
-    condition_lower = condition_name.lower()
-    
-    for condition, symptoms in symptom_database.items():
-        if condition in condition_lower or any(word in condition_lower for word in condition.split()):
-            related.extend(symptoms)
-    
-    # Remove duplicates and return
-    return list(dict.fromkeys(related))
+    related = {}
+    for match in _CONDITION_PATTERN.finditer(condition_name.lower()):
+        for symptom in SYMPTOM_DATABASE[match.group(0)]:
+            related[symptom] = None
+
+    # Dict keys preserve first-seen order with duplicates removed
+    return list(related)
+
+# Common symptoms in Indonesian, keyed by canonical name
+SYMPTOM_KEYWORDS = {
+    "demam": ["demam", "panas", "fever", "hot", "demam ringan", "demam tinggi"],
+    "batuk": ["batuk", "cough", "batuk kering", "batuk berdahak"],
+    "pilek": ["pilek", "ingus", "runny nose", "hidung tersumbat"],
+    "sakit kepala": ["sakit kepala", "pusing", "headache", "dizzy"],
+    "sakit tenggorokan": ["sakit tenggorokan", "tenggorokan sakit", "sore throat", "radang tenggorokan", "tenggorokan perih"],
+    "mual": ["mual", "nausea", "pengen muntah"],
+    "muntah": ["muntah", "vomit"],
+    "diare": ["diare", "mencret", "diarrhea", "bab cair"],
+    "konstipasi": ["konstipasi", "sembelit", "susah bab", "constipation"],
+    "nyeri perut": ["sakit perut", "nyeri perut", "perut sakit", "stomach pain"],
+    "sesak napas": ["sesak napas", "susah bernapas", "shortness of breath"],
+    "nyeri dada": ["sakit dada", "nyeri dada", "chest pain"],
+    "kelelahan": ["lelah", "capek", "fatigue", "tired"],
+    "nyeri otot": ["nyeri otot", "pegal", "muscle pain"],
+    "ruam": ["ruam", "bintik merah", "rash"],
+    "gatal": ["gatal", "itchy"],
+    "bengkak": ["bengkak", "swelling"],
+    "berkeringat": ["berkeringat", "sweating", "keringat berlebih"],
+    "hilang nafsu makan": ["tidak nafsu makan", "hilang nafsu makan", "tidak mau makan", "loss of appetite"],
+    "nyeri sendi": ["nyeri sendi", "sakit sendi", "joint pain"],
+    "menggigil": ["menggigil", "kedinginan", "chills", "shivering"]
+}
+
+# Flat keyword -> canonical symptom map, plus a single compiled alternation
+# over every keyword (longest first, so the most specific keyword wins).
+# Extraction then costs one C-level scan of the input instead of one
+# substring search per keyword.
+_KEYWORD_TO_SYMPTOM = {
+    keyword: symptom
+    for symptom, keywords in SYMPTOM_KEYWORDS.items()
+    for keyword in keywords
+}
+_SYMPTOM_PATTERN = re.compile(
+    "|".join(
+        re.escape(keyword)
+        for keyword in sorted(_KEYWORD_TO_SYMPTOM, key=len, reverse=True)
+    )
+)
+
+# Fused lowercase + punctuation normalization: one translate pass over the
+# input instead of a .lower() copy followed by separate cleanup
+_NORMALIZE = str.maketrans(
+    string.ascii_uppercase + ",.;!?", string.ascii_lowercase + "     "
+)
+
+# Optional Aho-Corasick automaton: one trie traversal finds every keyword,
+# including overlapping ones, and stays O(len(input)) however large the
+# dictionary grows. Falls back to the compiled alternation when
+# pyahocorasick is not installed.
+try:
+    import ahocorasick
+
+    _SYMPTOM_AUTOMATON = ahocorasick.Automaton()
+    for _keyword, _symptom in _KEYWORD_TO_SYMPTOM.items():
+        _SYMPTOM_AUTOMATON.add_word(_keyword, _symptom)
+    _SYMPTOM_AUTOMATON.make_automaton()
+except ImportError:
+    _SYMPTOM_AUTOMATON = None
+
+@lru_cache(maxsize=256)
+def _extract_symptoms_memo(user_input):
+    """Single automaton/pattern scan, memoized across reruns of the same text"""
+    text = user_input.translate(_NORMALIZE)
+    extracted = {}
+    if _SYMPTOM_AUTOMATON is not None:
+        for _, symptom in _SYMPTOM_AUTOMATON.iter(text):
+            extracted[symptom] = None
+    else:
+        for match in _SYMPTOM_PATTERN.finditer(text):
+            extracted[_KEYWORD_TO_SYMPTOM[match.group(0)]] = None
+
+    return tuple(extracted)
 
 def extract_symptoms_simple(user_input):
-    """Extract symptoms from user input using simple keyword matching"""
-    
-    # Common symptoms in Indonesian
-    symptom_keywords = {
-        "demam": ["demam", "panas", "fever", "hot", "demam ringan", "demam tinggi"],
-        "batuk": ["batuk", "cough", "batuk kering", "batuk berdahak"],
-        "pilek": ["pilek", "ingus", "runny nose", "hidung tersumbat"],
-        "sakit kepala": ["sakit kepala", "pusing", "headache", "dizzy"],
-        "sakit tenggorokan": ["sakit tenggorokan", "tenggorokan sakit", "sore throat", "radang tenggorokan", "tenggorokan perih"],
-        "mual": ["mual", "nausea", "pengen muntah"],
-        "muntah": ["muntah", "vomit"],
-        "diare": ["diare", "mencret", "diarrhea", "BAB cair"],
-        "konstipasi": ["konstipasi", "sembelit", "susah BAB", "constipation"],
-        "nyeri perut": ["sakit perut", "nyeri perut", "perut sakit", "stomach pain"],
-        "sesak napas": ["sesak napas", "susah bernapas", "shortness of breath"],
-        "nyeri dada": ["sakit dada", "nyeri dada", "chest pain"],
-        "kelelahan": ["lelah", "capek", "fatigue", "tired"],
-        "nyeri otot": ["nyeri otot", "pegal", "muscle pain"],
-        "ruam": ["ruam", "bintik merah", "rash"],
-        "gatal": ["gatal", "itchy"],
-        "bengkak": ["bengkak", "swelling"],
-        "berkeringat": ["berkeringat", "sweating", "keringat berlebih"],
-        "hilang nafsu makan": ["tidak nafsu makan", "hilang nafsu makan", "tidak mau makan", "loss of appetite"],
-        "nyeri sendi": ["nyeri sendi", "sakit sendi", "joint pain"],
-        "menggigil": ["menggigil", "kedinginan", "chills", "shivering"]
-    }
-    
-    user_input_lower = user_input.lower()
-    extracted = []
-    
-    for symptom, keywords in symptom_keywords.items():
-        for keyword in keywords:
-            if keyword in user_input_lower:
-                extracted.append(symptom)
-                break
-    
-    return list(dict.fromkeys(extracted))
+    """Extract symptoms from user input with a single automaton/pattern scan"""
+    # Fast path for empty input and the internal collection sentinel, which
+    # round-trips through here on every continue step
+    if not user_input or len(user_input) < 3 or user_input == "continue_symptom_collection":
+        return []
+    return list(_extract_symptoms_memo(user_input))
+
+def extract_symptoms_cached(text):
+    """Extract symptoms for a collected entry, memoized in session state.
+
+    The symptom-collection flow re-walks the whole transcript each turn;
+    caching per text keeps that amortized O(1) per new message.
+    """
+    cache = st.session_state.setdefault("extracted_cache", {})
+    if text not in cache:
+        cache[text] = extract_symptoms_simple(text)
+    return cache[text]
+
+# Symptom associations used to suggest likely co-occurring symptoms
+SYMPTOM_ASSOCIATIONS = {
+    "demam": ["sakit kepala", "kelelahan", "nyeri otot", "berkeringat", "menggigil", "hilang nafsu makan"],
+    "batuk": ["pilek", "sakit kepala", "kelelahan", "sakit tenggorokan"],
+    "pilek": ["batuk", "sakit kepala", "sakit tenggorokan"],
+    "sakit kepala": ["demam", "mual", "kelelahan"],
+    "sakit tenggorokan": ["demam", "batuk", "pilek", "sakit kepala", "kelelahan"],
+    "mual": ["muntah", "sakit kepala", "nyeri perut"],
+    "muntah": ["mual", "nyeri perut", "kelelahan"],
+    "diare": ["nyeri perut", "mual", "kelelahan"],
+    "nyeri perut": ["mual", "muntah", "diare"],
+    "sesak napas": ["batuk", "nyeri dada", "kelelahan"],
+    "nyeri dada": ["sesak napas", "kelelahan"],
+    "kelelahan": ["demam", "sakit kepala", "nyeri otot"],
+    "ruam": ["gatal", "demam"],
+    "gatal": ["ruam"],
+    "nyeri otot": ["demam", "kelelahan", "nyeri sendi"],
+    "nyeri sendi": ["nyeri otot", "kelelahan", "demam"],
+    "menggigil": ["demam", "kelelahan"]
+}
+
+# Immutable view used on the per-turn lookup path (tuples are smaller and
+# skip the membership pre-check via .get default)
+_ASSOC = {k: tuple(v) for k, v in SYMPTOM_ASSOCIATIONS.items()}
+
+@lru_cache(maxsize=256)
+def _related_symptoms_memo(extracted_key):
+    extracted_set = set(extracted_key)
+    candidates = chain.from_iterable(_ASSOC.get(s, ()) for s in extracted_key)
+    return tuple(s for s in dict.fromkeys(candidates) if s not in extracted_set)
 
 def get_related_symptoms_simple(extracted_symptoms):
     """Get related symptoms based on extracted symptoms"""
-    
-    # Symptom associations
-    associations = {
-        "demam": ["sakit kepala", "kelelahan", "nyeri otot", "berkeringat", "menggigil", "hilang nafsu makan"],
-        "batuk": ["pilek", "sakit kepala", "kelelahan", "sakit tenggorokan"],
-        "pilek": ["batuk", "sakit kepala", "sakit tenggorokan"],
-        "sakit kepala": ["demam", "mual", "kelelahan"],
-        "sakit tenggorokan": ["demam", "batuk", "pilek", "sakit kepala", "kelelahan"],
-        "mual": ["muntah", "sakit kepala", "nyeri perut"],
-        "muntah": ["mual", "nyeri perut", "kelelahan"],
-        "diare": ["nyeri perut", "mual", "kelelahan"],
-        "nyeri perut": ["mual", "muntah", "diare"],
-        "sesak napas": ["batuk", "nyeri dada", "kelelahan"],
-        "nyeri dada": ["sesak napas", "kelelahan"],
-        "kelelahan": ["demam", "sakit kepala", "nyeri otot"],
-        "ruam": ["gatal", "demam"],
-        "gatal": ["ruam"],
-        "nyeri otot": ["demam", "kelelahan", "nyeri sendi"],
-        "nyeri sendi": ["nyeri otot", "kelelahan", "demam"],
-        "menggigil": ["demam", "kelelahan"]
-    }
-    
-    related = []
-    for symptom in extracted_symptoms:
-        if symptom in associations:
-            related.extend(associations[symptom])
-    
-    # Remove duplicates and original symptoms
-    related = [s for s in list(dict.fromkeys(related)) if s not in extracted_symptoms]
-    
-    return related
+    if not extracted_symptoms:
+        return []
+    # Key on the original order: suggestion order tracks mention order
+    return list(_related_symptoms_memo(tuple(extracted_symptoms)))
+
+def _dedup_take(candidates, n, exclude=frozenset()):
+    """First n distinct candidates not in exclude, in first-seen order.
+
+    Single bounded pass: stops as soon as n survivors are collected instead
+    of deduplicating the whole sequence and truncating afterwards.
+    """
+    out = {}
+    for candidate in candidates:
+        if candidate not in exclude and candidate not in out:
+            out[candidate] = None
+            if len(out) == n:
+                break
+    return list(out)
 
 def get_related_symptoms_from_extraction(extracted_symptoms, condition_name):
     """Combine extracted symptoms with condition-based related symptoms"""
-    
+
     # Get symptoms from extraction
     related_from_symptoms = get_related_symptoms_simple(extracted_symptoms)
-    
+
     # Get symptoms from condition
     related_from_condition = get_related_symptoms(condition_name)
-    
-    # Combine and deduplicate
-    all_related = related_from_symptoms + related_from_condition
-    
-    # Remove duplicates and already mentioned symptoms
-    unique_related = []
-    for symptom in all_related:
-        if symptom not in unique_related and symptom not in extracted_symptoms:
-            unique_related.append(symptom)
-    
-    return unique_related[:8]  # Limit to 8 related symptoms
 
+    # Fused dedup + already-mentioned filter + limit in one bounded pass
+    return _dedup_take(
+        chain(related_from_symptoms, related_from_condition),
+        8,
+        exclude=set(extracted_symptoms),
+    )
+
+def _guideline_cache_file(md_files):
+    """Disk-cache path for the processed docs, keyed on the file fingerprint"""
+    from pathlib import Path
+
+    fingerprint = hashlib.sha256(repr(md_files).encode()).hexdigest()[:16]
+    return Path.home() / ".cache" / "triage" / f"guidelines-{fingerprint}.pkl"
+
+def _read_guideline_disk_cache(md_files):
+    import pickle
+
+    cache_file = _guideline_cache_file(md_files)
+    if cache_file.exists():
+        try:
+            return pickle.loads(cache_file.read_bytes())
+        except Exception:
+            pass  # corrupt/stale cache: rebuild below
+    return None
+
+def _write_guideline_disk_cache(md_files, docs):
+    import pickle
+
+    cache_file = _guideline_cache_file(md_files)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_bytes(pickle.dumps(docs))
+    except OSError:
+        pass  # read-only deployments simply skip the disk cache
+
+@st.cache_resource(show_spinner=False)
 def load_guidelines():
-    """Load medical guidelines from files"""
+    """Load medical guidelines from files (read once per process).
+
+    Content is lowercased here as well, so per-query matching never has to
+    re-lowercase whole documents.
+    """
     guidelines = {}
     guidelines_dir = "guidelines"
-    
+
+    def read_guideline(filepath):
+        with open(filepath, 'r', encoding='utf-8') as file:
+            return file.read()
+
+    md_files = []
     if os.path.exists(guidelines_dir):
-        for filename in os.listdir(guidelines_dir):
-            if filename.endswith('.md'):
-                filepath = os.path.join(guidelines_dir, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                        # Use filename without extension as key
-                        key = filename[:-3]
-                        guidelines[key] = content
-                except Exception as e:
-                    st.error(f"Error loading {filename}: {str(e)}")
-    
-    docs = [{"content": content, "source": key} for key, content in guidelines.items()]
+        with os.scandir(guidelines_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.md'):
+                    stat = entry.stat()
+                    md_files.append((entry.path, stat.st_mtime_ns, stat.st_size))
+        md_files.sort()
+
+    # Disk cache keyed on (paths, mtimes, sizes): a fresh Streamlit process
+    # after redeploy skips re-reading and re-tokenizing unchanged guidelines
+    cached_docs = _read_guideline_disk_cache(md_files)
+    if cached_docs is not None:
+        return cached_docs
+
+    if md_files:
+        md_paths = [path for path, _, _ in md_files]
+        # Overlap the cold-cache file reads; this runs once per process
+        with ThreadPoolExecutor(max_workers=min(8, max(1, len(md_paths)))) as executor:
+            futures = {path: executor.submit(read_guideline, path) for path in md_paths}
+        for path, future in futures.items():
+            filename = os.path.basename(path)
+            try:
+                # Use filename without extension as key
+                guidelines[filename[:-3]] = future.result()
+            except Exception as e:
+                st.error(f"Error loading {filename}: {str(e)}")
+
+    docs = [
+        {
+            "content": content,
+            "content_lower": content.lower(),
+            # Token set for O(1) matching of condition words against the doc
+            "tokens": set(re.findall(r"[a-z]{4,}", content.lower())),
+            "source": key,
+        }
+        for key, content in guidelines.items()
+    ]
+    _write_guideline_disk_cache(md_files, docs)
     return docs
 
+@st.cache_resource(show_spinner=False)
+def _guideline_postings():
+    """Inverted index over the guideline token sets: term -> doc indices"""
+    postings = defaultdict(list)
+    for doc_idx, doc in enumerate(load_guidelines()):
+        for token in doc['tokens']:
+            postings[token].append(doc_idx)
+    return dict(postings)
+
+
+@st.fragment
+def _render_followup_ui(related_symptoms, followup_msg_id):
+    """Interactive symptom-selection block, scoped to its own reruns.
+
+    Multiselect changes rerun only this fragment instead of the whole
+    script; actions that change the conversation (adding symptoms,
+    triggering analysis) escalate with st.rerun(scope="app").
+    """
+    st.markdown("---")
+    
+    # Show collected symptoms summary
+    collected = st.session_state.get("collected_symptoms", [])
+    if collected:
+        st.markdown("### � Gejala yang telah dikumpulkan:")
+        for i, symptom in enumerate(collected, 1):
+            st.markdown(f"**{i}.** {symptom}")
+    
+    # Show additional symptom selection if we have related symptoms
+    if related_symptoms:
+        st.markdown("## �🔍 Apakah Anda mengalami gejala tambahan berikut?")
+        st.markdown("*Gunakan antarmuka di bawah ini untuk memilih gejala tambahan.*")
+        
+        # Initialize selected additional symptoms in session state
+        if "selected_additional_symptoms" not in st.session_state:
+            st.session_state.selected_additional_symptoms = []
+        
+        # Create multiselect for additional symptoms
+        selected_symptoms = st.multiselect(
+            "Pilih gejala tambahan yang Anda alami:",
+            options=related_symptoms,
+            default=st.session_state.selected_additional_symptoms,
+            key=f"current_additional_symptoms_{followup_msg_id}"
+        )
+        
+        # Update session state
+        st.session_state.selected_additional_symptoms = selected_symptoms
+        
+        # Show selected symptoms as tags
+        if selected_symptoms:
+            st.markdown("**Gejala tambahan yang dipilih:**")
+            tags_html = "".join(_SYMPTOM_TAG_TEMPLATE.format(s) for s in selected_symptoms)
+            st.markdown(tags_html, unsafe_allow_html=True)
+    else:
+        st.markdown("## 💬 Anda dapat menambahkan gejala lain melalui chat atau lanjut analisis")
+    
+    # Action buttons
+    st.markdown("---")
+    
+    if related_symptoms:
+        # Show both buttons when we have related symptoms
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if st.button("➕ Tambah gejala terpilih", key=f"current_add_selected_{followup_msg_id}", use_container_width=True):
+                if st.session_state.selected_additional_symptoms:
+                    # Add selected symptoms to collected symptoms
+                    additional_symptoms_text = f"Saya juga mengalami: {', '.join(st.session_state.selected_additional_symptoms)}"
+                    st.session_state.collected_symptoms.append(additional_symptoms_text)
+                    
+                    # Add to chat history
+                    st.session_state.chat_history.append({"role": "user", "content": additional_symptoms_text})
+                    
+                    # Clear selected symptoms for next round
+                    st.session_state.selected_additional_symptoms = []
+                    
+                    # Continue with more symptom collection
+                    st.session_state.selected_symptom = "continue_symptom_collection"
+                    st.rerun(scope="app")
+                else:
+                    st.warning("Silakan pilih setidaknya satu gejala terlebih dahulu.")
+        
+        with col2:
+            if st.button("✅ Selesai, analisis sekarang", key=f"current_done_{followup_msg_id}", type="primary", use_container_width=True):
+                # Add any remaining selected symptoms before analysis
+                if st.session_state.get("selected_additional_symptoms", []):
+                    additional_symptoms_text = f"Saya juga mengalami: {', '.join(st.session_state.selected_additional_symptoms)}"
+                    st.session_state.collected_symptoms.append(additional_symptoms_text)
+                    st.session_state.chat_history.append({"role": "user", "content": additional_symptoms_text})
+                
+                # Ensure we have collected symptoms
+                collected = st.session_state.get("collected_symptoms", [])
+                if not collected:
+                    st.error("Tidak ada gejala yang terkumpul. Silakan coba lagi.")
+                    return
+                
+                # Set a flag to trigger analysis
+                st.session_state.trigger_analysis = True
+                st.rerun(scope="app")
+    else:
+        # Show only the analysis button when no related symptoms
+        if st.button("✅ Selesai, analisis sekarang", key=f"current_done_no_related_{followup_msg_id}", type="primary", use_container_width=True):
+            # Ensure we have collected symptoms
+            collected = st.session_state.get("collected_symptoms", [])
+            if not collected:
+                st.error("Tidak ada gejala yang terkumpul. Silakan coba lagi.")
+                return
+            
+            # Set a flag to trigger analysis
+            st.session_state.trigger_analysis = True
+            st.rerun(scope="app")
 
 def main():
     # Header
@@ -789,13 +1145,8 @@ def main():
         st.markdown("## ⚙️ Settings")
         
         def clear_conversation():
-            keys_to_clear = [
-                'chat_history', 'symptom_collection_mode', 'collected_symptoms',
-                'selected_additional_symptoms', 'trigger_analysis', 'prev_question_timestamp'
-            ]
-            for key in keys_to_clear:
-                if key in st.session_state:
-                    del st.session_state[key]
+            for key in KEYS_TO_CLEAR:
+                st.session_state.pop(key, None)
             st.rerun()
         
         if st.button("🗑️ Clear Conversation", use_container_width=True):
@@ -851,28 +1202,7 @@ def main():
             if debug_models:
                 st.info("Click 'Check Available Models' button below to see which models work with your API key.")
     
-    # API Key Management
-    def get_api_key():
-        # Try to get from Streamlit secrets first
-        try:
-            if "api_keys" in st.secrets:
-                return st.secrets["api_keys"]["gemini_api_key"]
-            elif "gemini_api_key" in st.secrets:
-                return st.secrets["gemini_api_key"]
-        except:
-            pass
-        
-        # Try environment variable
-        env_key = os.getenv('GEMINI_API_KEY')
-        if env_key:
-            return env_key
-        
-        # Finally check session state
-        if 'user_api_key' in st.session_state and st.session_state.user_api_key:
-            return st.session_state.user_api_key
-            
-        return None
-
+    # API Key Management (module-level memoized helpers)
     api_key = get_api_key()
     
     if not api_key:
@@ -898,24 +1228,18 @@ def main():
         return
     
     # Exa API Key for enhanced web search
-    def get_exa_api_key():
+    exa_api_key = get_exa_api_key()
+
+    # Resolve the hybrid engine handle once per rerun; the heavy setup
+    # (embeddings, FAISS index) lives behind st.cache_resource, so this is
+    # a warm lookup everywhere below instead of a per-analysis resolution
+    hybrid_retriever = None
+    if HYBRID_AVAILABLE and st.session_state.get('use_hybrid_mode', True):
         try:
-            if "exa_api_key" in st.secrets:
-                return st.secrets["exa_api_key"]
-        except:
-            pass
-        
-        env_key = os.getenv('EXA_API_KEY')
-        if env_key:
-            return env_key
-            
-        if 'user_exa_key' in st.session_state and st.session_state.user_exa_key:
-            return st.session_state.user_exa_key
-            
-        return None
+            hybrid_retriever = get_hybrid_retriever(api_key, exa_api_key)
+        except Exception:
+            hybrid_retriever = None
 
-    exa_api_key = get_exa_api_key()
-    
     # Debug: Check available models if requested
     if st.session_state.get('debug_models', False):
         with st.sidebar:
@@ -973,23 +1297,29 @@ def main():
     if user_input:
         # Handle continuation of symptom collection
         if user_input == "continue_symptom_collection":
-            # Get all previously mentioned symptoms using simple extraction
-            all_previous_symptoms = []
-            for symptom_text in st.session_state.collected_symptoms:
-                all_previous_symptoms.extend(extract_symptoms_simple(symptom_text))
+            # Get all previously mentioned symptoms; each transcript entry
+            # is only ever extracted once thanks to the session cache
+            all_previous_symptoms = list(dict.fromkeys(
+                symptom
+                for symptom_text in st.session_state.collected_symptoms
+                for symptom in extract_symptoms_cached(symptom_text)
+            ))
             
             with st.spinner("Mencari gejala terkait lainnya..."):
                 # Get related symptoms based on all collected symptoms
                 related_symptoms = get_related_symptoms_simple(all_previous_symptoms)
             
             # Show follow-up questions for additional symptoms
+            st.session_state.msg_counter = st.session_state.get("msg_counter", 0) + 1
             st.session_state.chat_history.append({
-                "role": "assistant", 
+                "role": "assistant",
                 "content": f"Bagus! Sekarang mari saya tanyakan tentang gejala terkait lainnya:",
                 "follow_up": True,
+                "msg_id": st.session_state.msg_counter,
                 "related_symptoms": related_symptoms,
                 "extracted_symptoms": all_previous_symptoms
             })
+            st.session_state.latest_followup = st.session_state.chat_history[-1]
             st.rerun()
             return
         # Initialize symptom collection session state
@@ -1031,127 +1361,33 @@ def main():
         else:
             assistant_message = "Saya telah menerima pesan Anda. Mari saya tanyakan tentang gejala terkait lainnya:"
         
+        st.session_state.msg_counter = st.session_state.get("msg_counter", 0) + 1
         st.session_state.chat_history.append({
-            "role": "assistant", 
+            "role": "assistant",
             "content": assistant_message,
             "follow_up": True,
+            "msg_id": st.session_state.msg_counter,
             "related_symptoms": related_symptoms,
             "extracted_symptoms": extracted_symptoms
         })
+        st.session_state.latest_followup = st.session_state.chat_history[-1]
         
         with st.chat_message("assistant"):
             st.markdown(assistant_message)
 
     # Show single interactive symptom selection interface
-    # Find the most recent follow-up message
-    latest_followup = None
-    related_symptoms = []
-    if st.session_state.get("chat_history", []):
-        for chat in reversed(st.session_state.chat_history):
-            if chat.get("follow_up", False):
-                latest_followup = chat
-                related_symptoms = chat.get("related_symptoms", [])
-                break
+    # The most recent follow-up message is tracked at append time, so no
+    # history scan is needed here
+    latest_followup = st.session_state.get("latest_followup")
+    related_symptoms = latest_followup.get("related_symptoms", []) if latest_followup else []
+    followup_msg_id = latest_followup.get("msg_id", 0) if latest_followup else 0
     
     # Check if analysis is finished
-    analysis_finished = any(chat.get("final_analysis", False) for chat in st.session_state.get("chat_history", []))
+    analysis_finished = st.session_state.get("analysis_finished", False)
     
     # Show interface if we're in symptom collection mode and haven't finished analysis
     if st.session_state.get("symptom_collection_mode", False) and not analysis_finished:
-        st.markdown("---")
-        
-        # Show collected symptoms summary
-        collected = st.session_state.get("collected_symptoms", [])
-        if collected:
-            st.markdown("### � Gejala yang telah dikumpulkan:")
-            for i, symptom in enumerate(collected, 1):
-                st.markdown(f"**{i}.** {symptom}")
-        
-        # Show additional symptom selection if we have related symptoms
-        if related_symptoms:
-            st.markdown("## �🔍 Apakah Anda mengalami gejala tambahan berikut?")
-            st.markdown("*Gunakan antarmuka di bawah ini untuk memilih gejala tambahan.*")
-            
-            # Initialize selected additional symptoms in session state
-            if "selected_additional_symptoms" not in st.session_state:
-                st.session_state.selected_additional_symptoms = []
-            
-            # Create multiselect for additional symptoms
-            selected_symptoms = st.multiselect(
-                "Pilih gejala tambahan yang Anda alami:",
-                options=related_symptoms,
-                default=st.session_state.selected_additional_symptoms,
-                key=f"current_additional_symptoms_{len(st.session_state.get('chat_history', []))}_{hash(str(related_symptoms))}"
-            )
-            
-            # Update session state
-            st.session_state.selected_additional_symptoms = selected_symptoms
-            
-            # Show selected symptoms as tags
-            if selected_symptoms:
-                st.markdown("**Gejala tambahan yang dipilih:**")
-                tags_html = ""
-                for symptom in selected_symptoms:
-                    tags_html += f'<span style="background-color: #e1f5fe; color: #01579b; padding: 4px 8px; margin: 2px; border-radius: 12px; font-size: 12px; display: inline-block;">🔸 {symptom}</span>'
-                st.markdown(tags_html, unsafe_allow_html=True)
-        else:
-            st.markdown("## 💬 Anda dapat menambahkan gejala lain melalui chat atau lanjut analisis")
-        
-        # Action buttons
-        st.markdown("---")
-        
-        if related_symptoms:
-            # Show both buttons when we have related symptoms
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if st.button("➕ Tambah gejala terpilih", key=f"current_add_selected_{len(st.session_state.get('chat_history', []))}", use_container_width=True):
-                    if st.session_state.selected_additional_symptoms:
-                        # Add selected symptoms to collected symptoms
-                        additional_symptoms_text = f"Saya juga mengalami: {', '.join(st.session_state.selected_additional_symptoms)}"
-                        st.session_state.collected_symptoms.append(additional_symptoms_text)
-                        
-                        # Add to chat history
-                        st.session_state.chat_history.append({"role": "user", "content": additional_symptoms_text})
-                        
-                        # Clear selected symptoms for next round
-                        st.session_state.selected_additional_symptoms = []
-                        
-                        # Continue with more symptom collection
-                        st.session_state.selected_symptom = "continue_symptom_collection"
-                        st.rerun()
-                    else:
-                        st.warning("Silakan pilih setidaknya satu gejala terlebih dahulu.")
-            
-            with col2:
-                if st.button("✅ Selesai, analisis sekarang", key=f"current_done_{len(st.session_state.get('chat_history', []))}", type="primary", use_container_width=True):
-                    # Add any remaining selected symptoms before analysis
-                    if st.session_state.get("selected_additional_symptoms", []):
-                        additional_symptoms_text = f"Saya juga mengalami: {', '.join(st.session_state.selected_additional_symptoms)}"
-                        st.session_state.collected_symptoms.append(additional_symptoms_text)
-                        st.session_state.chat_history.append({"role": "user", "content": additional_symptoms_text})
-                    
-                    # Ensure we have collected symptoms
-                    collected = st.session_state.get("collected_symptoms", [])
-                    if not collected:
-                        st.error("Tidak ada gejala yang terkumpul. Silakan coba lagi.")
-                        return
-                    
-                    # Set a flag to trigger analysis
-                    st.session_state.trigger_analysis = True
-                    st.rerun()
-        else:
-            # Show only the analysis button when no related symptoms
-            if st.button("✅ Selesai, analisis sekarang", key=f"current_done_no_related_{len(st.session_state.get('chat_history', []))}", type="primary", use_container_width=True):
-                # Ensure we have collected symptoms
-                collected = st.session_state.get("collected_symptoms", [])
-                if not collected:
-                    st.error("Tidak ada gejala yang terkumpul. Silakan coba lagi.")
-                    return
-                
-                # Set a flag to trigger analysis
-                st.session_state.trigger_analysis = True
-                st.rerun()
+        _render_followup_ui(related_symptoms, followup_msg_id)
 
     # Handle analysis trigger (must be outside the user_input block)
     if st.session_state.get("trigger_analysis", False):
@@ -1163,11 +1399,12 @@ def main():
         
         # Perform final analysis with all collected symptoms
         if collected:
-            all_symptoms = " dan ".join(collected)
-            final_input = f"Ringkasan gejala lengkap: {all_symptoms}"
+            # Single newline join keeps the symptoms as a clean bullet list
+            # the model doesn't have to re-parse out of prose
+            final_input = "Ringkasan gejala lengkap:\n- " + "\n- ".join(collected)
             
             # Use the enhanced progress bar for analysis
-            final_triage = perform_analysis_with_progress(final_input, api_key, exa_api_key)
+            final_triage = perform_analysis_with_progress(final_input, api_key, exa_api_key, retriever=hybrid_retriever)
             
             # Add final analysis to chat
             st.session_state.chat_history.append({
@@ -1176,7 +1413,8 @@ def main():
                 "triage": final_triage,
                 "final_analysis": True
             })
-            
+            st.session_state.analysis_finished = True
+
             # Reset symptom collection mode
             st.session_state.symptom_collection_mode = False
             st.session_state.collected_symptoms = []
@@ -1184,38 +1422,81 @@ def main():
             st.rerun()
 
     # Initialize timestamp tracking
-    if "prev_question_timestamp" not in st.session_state:
-        st.session_state.prev_question_timestamp = datetime.datetime.fromtimestamp(0)
+    st.session_state.setdefault("prev_question_timestamp", datetime.datetime.fromtimestamp(0))
 
-def get_relevant_guideline(conditions, symptoms):
-    """Get relevant medical guideline based on conditions and symptoms"""
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def _score_guidelines(query_key: tuple) -> str:
+    """Pick the best-matching guideline for a canonical query-word tuple.
+
+    Cached per query so repeat analyses with the same conditions skip the
+    scoring loop entirely; the docs themselves are already cached in
+    load_guidelines.
+    """
     docs = load_guidelines()
-    if not docs:
-        return "No guidelines available. Please consult with a healthcare professional for proper medical advice."
-    
-    # Simple keyword matching to find relevant guidelines
-    relevant_content = []
-    
-    for doc in docs:
-        content = doc['content'].lower()
-        source = doc['source']
-        
-        # Check if any condition or symptom matches the guideline content
-        for condition in conditions:
-            condition_name = condition.get('name', '').lower()
-            if any(word in content for word in condition_name.split() if len(word) > 3):
-                relevant_content.append(f"From {source}:\n{doc['content']}")
-                break
-    
-    if relevant_content:
-        # Return first relevant guideline (truncated)
-        content = relevant_content[0]
-        return content[:1000] + "..." if len(content) > 1000 else content
+    postings = _guideline_postings()
+
+    # Walk only the postings for the query terms; documents that share no
+    # term with the query are never touched
+    scores = Counter()
+    for term in query_key:
+        for doc_idx in postings.get(term, ()):
+            scores[doc_idx] += 1
+
+    best_doc = None
+    if scores:
+        # Highest score wins; ties keep the earlier doc, deterministically
+        best_doc = docs[min(scores, key=lambda idx: (-scores[idx], idx))]
+
+    if best_doc is not None:
+        return _format_guideline(best_doc)
     else:
         # Fallback to general guideline
         fallback = docs[0]['content'] if docs else "Please consult with a healthcare professional."
         return fallback[:1000] + "..." if len(fallback) > 1000 else fallback
 
+def _format_guideline(doc) -> str:
+    content = f"From {doc['source']}:\n{doc['content']}"
+    return content[:1000] + "..." if len(content) > 1000 else content
+
+@st.cache_resource(show_spinner=False)
+def _condition_doc_map():
+    """Direct condition-keyword -> doc-index map derived from the filenames"""
+    mapping = {}
+    for doc_idx, doc in enumerate(load_guidelines()):
+        for word in doc['source'].lower().split('_'):
+            word = re.sub(r"[^a-z0-9]+", "", word)
+            if len(word) > 3 and word not in mapping:
+                mapping[word] = doc_idx
+    return mapping
+
+def get_relevant_guideline(conditions, symptoms):
+    """Get relevant medical guideline based on conditions and symptoms"""
+    docs = load_guidelines()
+    if not docs:
+        return "No guidelines available. Please consult with a healthcare professional for proper medical advice."
+
+    # Fast path: an obvious 1:1 match between a condition name and a
+    # guideline filename (e.g. "dengue") skips scoring entirely.
+    # Conditions arrive in likelihood order, so the first hit wins.
+    # Condition names are squashed to alphanumerics so punctuated forms
+    # still hit filename keywords (e.g. "COVID-19" -> "covid19")
+    doc_map = _condition_doc_map()
+    for condition in conditions:
+        name = re.sub(r"[^a-z0-9]+", "", condition.get('name', '').lower())
+        for keyword, doc_idx in doc_map.items():
+            if keyword in name:
+                return _format_guideline(docs[doc_idx])
+
+    # Score condition words against the inverted guideline index; only
+    # postings for the query terms are walked, never full documents.
+    # Tokenize exactly like the corpus so punctuated names still match.
+    query_words = {
+        word
+        for condition in conditions
+        for word in re.findall(r"[a-z]{4,}", condition.get('name', '').lower())
+    }
+    return _score_guidelines(tuple(sorted(query_words)))
+
 @st.dialog("🏥 Panduan Prioritas Medis - Sistem Triase", width="large")
 def show_triage_modal():
     # Add custom CSS for wider modal
@@ -6,13 +6,21 @@ Combines:
 3. Intelligent source ranking and combination
 """
 
+import hashlib
+import heapq
 import os
 import glob
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 from typing import List, Dict, Optional
 import streamlit as st
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
@@ -24,64 +32,221 @@ except ImportError:
     EXA_AVAILABLE = False
     st.warning("Exa not available. Install with: pip install exa-py")
 
+@st.cache_resource(show_spinner=False)
+def _load_local_embeddings():
+    """Instantiate the local sentence-transformers embedder once per process"""
+    try:
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        device = "cpu"
+    return HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        model_kwargs={"device": device},
+        encode_kwargs={"batch_size": 64, "normalize_embeddings": True}
+    )
+
+@st.cache_resource(show_spinner=False)
+def _load_gemini_embeddings(gemini_api_key: str):
+    """Instantiate the Gemini embedding client once per API key"""
+    return GoogleGenerativeAIEmbeddings(
+        model="models/embedding-001",
+        google_api_key=gemini_api_key
+    )
+
+@st.cache_resource(show_spinner=False)
+def _cached_vectorstore(fingerprint: str, embedding_label: str, _embeddings, _retriever):
+    """Process-wide vector store cache, keyed on the guideline fingerprint.
+
+    The underscore args are excluded from Streamlit's hashing, so the store
+    survives retriever re-creation (e.g. API key changes) as long as the
+    guideline files are unchanged.
+    """
+    return _retriever._build_or_load_vectorstore(_embeddings, embedding_label)
+
 class HybridMedicalRetriever:
     def __init__(self, gemini_api_key: str, exa_api_key: Optional[str] = None):
         self.gemini_api_key = gemini_api_key
         self.exa_api_key = exa_api_key
         self.local_vectorstore = None
+        self.embeddings = None
         self.exa_client = None
+        # Bounded memo of query embeddings; multi-turn triage re-submits
+        # overlapping queries and re-embedding them is pure waste
+        self._query_vector_cache = {}
+        # Inverted index for the keyword fallback, built on first use
+        self._fallback_index = None
+        # Loaded guideline Documents, read from disk once per retriever
+        self._documents_cache = None
+        # TTL cache of Exa results; conversational turns repeat queries
+        self._web_cache = {}
+        # Size-1 memo of the last hybrid_search call; Streamlit reruns the
+        # script on widget interaction and repeats the same turn's search.
+        # Key and result live in one tuple so concurrent readers on this
+        # shared (st.cache_resource) instance never see them torn apart.
+        self._last_hybrid = None
         
         # Initialize components
         self._setup_local_rag()
         if exa_api_key and EXA_AVAILABLE:
             self._setup_exa()
     
+    def _guidelines_fingerprint(self) -> str:
+        """Fingerprint of the guideline files (names, mtimes, sizes)"""
+        guideline_folder = os.path.join(os.path.dirname(__file__), "guidelines")
+        entries = []
+        for file_path in sorted(glob.glob(os.path.join(guideline_folder, "*.md"))):
+            stat = os.stat(file_path)
+            entries.append((os.path.basename(file_path), stat.st_mtime_ns, stat.st_size))
+        return hashlib.sha256(repr(entries).encode()).hexdigest()
+
+    def _build_or_load_vectorstore(self, embeddings, embedding_label: str):
+        """Load the persisted FAISS index if the guidelines are unchanged,
+        otherwise embed and build it, then persist it for the next start.
+
+        Warm starts cost a disk read instead of re-embedding every chunk.
+        """
+        index_dir = os.path.join(os.path.dirname(__file__), f"guidelines_index_{embedding_label}")
+        fingerprint_file = os.path.join(index_dir, "fingerprint.txt")
+        fingerprint = self._guidelines_fingerprint()
+
+        if os.path.exists(fingerprint_file):
+            try:
+                with open(fingerprint_file, 'r', encoding='utf-8') as f:
+                    if f.read().strip() == fingerprint:
+                        return FAISS.load_local(
+                            index_dir, embeddings,
+                            allow_dangerous_deserialization=True
+                        )
+            except Exception:
+                pass  # stale or corrupt index: rebuild below
+
+        documents = self._load_medical_guidelines()
+        if not documents:
+            return None
+
+        text_splitter = self._make_text_splitter()
+        splits = text_splitter.split_documents(documents)
+
+        # Embed every chunk in one batched call rather than per-chunk
+        # requests; API round-trips and tokenizer startup amortize across
+        # the whole corpus
+        texts = [split.page_content for split in splits]
+        metadatas = [split.metadata for split in splits]
+        vectors = embeddings.embed_documents(texts)
+
+        if len(texts) >= 1000:
+            # Large corpus: HNSW gives sub-linear search at near-exact
+            # recall instead of IndexFlat's full scan per query
+            vectorstore = self._build_hnsw_vectorstore(embeddings, texts, metadatas, vectors)
+        else:
+            # Normalized inner product == cosine: the scan is a pure dot
+            # product per vector and scores come back as real similarities
+            vectorstore = FAISS.from_embeddings(
+                list(zip(texts, vectors)), embeddings, metadatas=metadatas,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+                normalize_L2=True,
+            )
+
+        try:
+            vectorstore.save_local(index_dir)
+            with open(fingerprint_file, 'w', encoding='utf-8') as f:
+                f.write(fingerprint)
+        except OSError:
+            pass  # read-only deployments just rebuild next start
+
+        return vectorstore
+
+    # Splitting on markdown headings first keeps each chunk inside one
+    # guideline section, so overlap carries less duplicated context
+    _SPLIT_SEPARATORS = ["\n## ", "\n### ", "\n\n", "\n", ". ", " "]
+
+    @staticmethod
+    def _make_text_splitter() -> RecursiveCharacterTextSplitter:
+        """Token-based splitter: fewer, better-aligned chunks than the
+        character-count default, so fewer embeddings and a smaller index."""
+        try:
+            return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                chunk_size=512,
+                chunk_overlap=64,
+                encoding_name="cl100k_base",
+                separators=HybridMedicalRetriever._SPLIT_SEPARATORS
+            )
+        except Exception:
+            # tiktoken unavailable: keep the character-based splitter but
+            # still honour section boundaries
+            return RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                separators=HybridMedicalRetriever._SPLIT_SEPARATORS
+            )
+
+    @staticmethod
+    def _build_hnsw_vectorstore(embeddings, texts, metadatas, vectors):
+        """Assemble a FAISS wrapper around an HNSW index for large corpora"""
+        import faiss
+        import numpy as np
+        from langchain.schema import Document
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+
+        array = np.asarray(vectors, dtype="float32")
+        faiss.normalize_L2(array)
+        if len(texts) >= 10000:
+            # Very large corpus: 8-bit scalar quantization quarters the
+            # bytes scanned per distance computation, with negligible
+            # recall loss on normalized sentence embeddings
+            index = faiss.IndexHNSWSQ(
+                array.shape[1], faiss.ScalarQuantizer.QT_8bit, 32,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(array)
+        else:
+            index = faiss.IndexHNSWFlat(array.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = 200
+        index.hnsw.efSearch = 64
+        index.add(array)
+
+        docstore = InMemoryDocstore({
+            str(i): Document(page_content=text, metadata=metadata)
+            for i, (text, metadata) in enumerate(zip(texts, metadatas))
+        })
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id={i: str(i) for i in range(len(texts))},
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            normalize_L2=True,
+        )
+
     def _setup_local_rag(self):
         """Setup LangChain RAG for local medical guidelines"""
         try:
-            # Use Google's embeddings for better medical understanding
-            embeddings = GoogleGenerativeAIEmbeddings(
-                model="models/embedding-001",
-                google_api_key=self.gemini_api_key
+            # Local embeddings by default: no network round-trip per chunk
+            # or query, no quota, and 384-d vectors halve scan bandwidth
+            embeddings = _load_local_embeddings()
+            self.local_vectorstore = _cached_vectorstore(
+                self._guidelines_fingerprint(), "hf", embeddings, self
             )
-            
-            # Load and process medical guidelines
-            documents = self._load_medical_guidelines()
-            if documents:
-                # Split documents into chunks
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1000,
-                    chunk_overlap=200,
-                    length_function=len
-                )
-                splits = text_splitter.split_documents(documents)
-                
-                # Create vector store
-                self.local_vectorstore = FAISS.from_documents(splits, embeddings)
-                st.success(f"✅ Loaded {len(documents)} medical guidelines into RAG system")
+            self.embeddings = embeddings
+            if self.local_vectorstore is not None:
+                st.success("✅ Loaded medical guidelines into RAG system")
             else:
                 st.warning("⚠️ No medical guidelines found")
-                
+
         except Exception as e:
-            error_msg = str(e)
-            if "quota" in error_msg.lower() or "429" in error_msg:
-                st.warning("⚠️ Gemini embeddings quota exceeded. Using fallback embeddings.")
-            else:
-                st.error(f"❌ Error setting up Gemini RAG: {e}")
-            
-            # Fallback to HuggingFace embeddings
+            st.error(f"❌ Error setting up local embeddings: {e}")
+
+            # Fallback to the Gemini embedding API
             try:
-                st.info("🔄 Switching to HuggingFace embeddings (free, no quota limits)...")
-                embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-                documents = self._load_medical_guidelines()
-                if documents:
-                    text_splitter = RecursiveCharacterTextSplitter(
-                        chunk_size=1000,
-                        chunk_overlap=200
-                    )
-                    splits = text_splitter.split_documents(documents)
-                    self.local_vectorstore = FAISS.from_documents(splits, embeddings)
-                    st.success(f"✅ Loaded {len(documents)} guidelines (HuggingFace embeddings)")
+                st.info("🔄 Switching to Gemini embeddings...")
+                embeddings = _load_gemini_embeddings(self.gemini_api_key)
+                self.local_vectorstore = _cached_vectorstore(
+                    self._guidelines_fingerprint(), "gemini", embeddings, self
+                )
+                self.embeddings = embeddings
+                if self.local_vectorstore is not None:
+                    st.success("✅ Loaded guidelines (Gemini embeddings)")
                 else:
                     st.warning("⚠️ No medical guidelines found to load")
             except Exception as fallback_error:
@@ -97,30 +262,43 @@ class HybridMedicalRetriever:
             st.warning(f"⚠️ Exa setup failed: {e}")
     
     def _load_medical_guidelines(self):
-        """Load medical guidelines from the guidelines folder"""
+        """Load medical guidelines from the guidelines folder (cached on self)"""
         from langchain.schema import Document
-        
-        guideline_folder = os.path.join(os.path.dirname(__file__), "guidelines")
+
+        if self._documents_cache is not None:
+            return self._documents_cache
+
+        guideline_folder = Path(__file__).parent / "guidelines"
         documents = []
-        
+
         # Load markdown files
-        md_files = glob.glob(os.path.join(guideline_folder, "*.md"))
-        for file_path in md_files:
+        for file_path in sorted(guideline_folder.glob("*.md")):
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    documents.append(Document(
-                        page_content=content,
-                        metadata={
-                            'source': os.path.basename(file_path),
-                            'type': 'local_guideline'
-                        }
-                    ))
+                documents.append(Document(
+                    page_content=file_path.read_text(encoding='utf-8'),
+                    metadata={
+                        'source': file_path.name,
+                        'type': 'local_guideline'
+                    }
+                ))
             except Exception as e:
                 st.warning(f"Could not load {file_path}: {e}")
-        
+
+        self._documents_cache = documents
         return documents
     
+    def _embed_query_cached(self, query: str):
+        """Embed a query once; repeats hit the bounded in-memory cache"""
+        key = hashlib.blake2b(query.encode(), digest_size=16).digest()
+        vector = self._query_vector_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            if len(self._query_vector_cache) >= 256:
+                # Drop the oldest entry to bound memory
+                self._query_vector_cache.pop(next(iter(self._query_vector_cache)))
+            self._query_vector_cache[key] = vector
+        return vector
+
     def search_local_guidelines(self, query: str, k: int = 3) -> List[Dict]:
         """Search local medical guidelines using RAG"""
         if not self.local_vectorstore:
@@ -128,74 +306,185 @@ class HybridMedicalRetriever:
             return self._fallback_keyword_search(query, k)
         
         try:
-            docs = self.local_vectorstore.similarity_search(query, k=k)
+            docs_with_scores = self.local_vectorstore.similarity_search_with_score_by_vector(
+                self._embed_query_cached(query), k=k
+            )
             results = []
-            for doc in docs:
+            for doc, score in docs_with_scores:
                 results.append({
                     'content': doc.page_content,
                     'source': doc.metadata.get('source', 'unknown'),
                     'type': 'local_guideline',
-                    'relevance_score': 0.8  # High relevance for local guidelines
+                    # Inner product over normalized vectors is the cosine
+                    # similarity, so the real score replaces the fixed 0.8
+                    'relevance_score': float(score)
                 })
             return results
         except Exception as e:
             st.warning(f"RAG search failed, using keyword fallback: {e}")
             return self._fallback_keyword_search(query, k)
     
+    def _ensure_fallback_index(self):
+        """Build the keyword fallback's inverted index once.
+
+        Tokenizes each guideline a single time into term-frequency postings
+        and pre-truncated snippets, so query scoring walks only the postings
+        for the query tokens instead of substring-scanning every document.
+        """
+        if self._fallback_index is not None:
+            return self._fallback_index
+
+        postings = defaultdict(dict)
+        entries = []
+        for doc_idx, doc in enumerate(self._load_medical_guidelines()):
+            content = doc.page_content
+            for token in re.findall(r"\w+", content.lower()):
+                counts = postings[token]
+                counts[doc_idx] = counts.get(doc_idx, 0) + 1
+            entries.append({
+                'content': content[:1000] + "..." if len(content) > 1000 else content,
+                'source': doc.metadata.get('source', 'unknown'),
+            })
+        self._fallback_index = (dict(postings), entries)
+        return self._fallback_index
+
+    def search_local_guidelines_batch(self, queries: List[str], k: int = 3) -> List[List[Dict]]:
+        """Search several sub-queries in one embedder and one FAISS call.
+
+        Embedding N queries together is one batched forward pass instead of
+        N, and index.search on the stacked matrix is a single C++ call; use
+        this for per-symptom evidence expansion.
+        """
+        if not queries:
+            return []
+        if not self.local_vectorstore:
+            return [self._fallback_keyword_search(query, k) for query in queries]
+
+        try:
+            import faiss
+            import numpy as np
+
+            vectors = np.asarray(self.embeddings.embed_documents(queries), dtype="float32")
+            faiss.normalize_L2(vectors)
+            scores, indices = self.local_vectorstore.index.search(vectors, k)
+
+            results = []
+            for row_scores, row_indices in zip(scores, indices):
+                row = []
+                for score, idx in zip(row_scores, row_indices):
+                    if idx == -1:
+                        continue
+                    doc_id = self.local_vectorstore.index_to_docstore_id[int(idx)]
+                    doc = self.local_vectorstore.docstore.search(doc_id)
+                    row.append({
+                        'content': doc.page_content,
+                        'source': doc.metadata.get('source', 'unknown'),
+                        'type': 'local_guideline',
+                        'relevance_score': float(score)
+                    })
+                results.append(row)
+            return results
+        except Exception as e:
+            st.warning(f"Batch RAG search failed, using keyword fallback: {e}")
+            return [self._fallback_keyword_search(query, k) for query in queries]
+
     def _fallback_keyword_search(self, query: str, k: int = 3) -> List[Dict]:
         """Fallback keyword search when RAG is not available"""
-        documents = self._load_medical_guidelines()
-        if not documents:
+        postings, entries = self._ensure_fallback_index()
+        if not entries:
             return []
-        
-        query_lower = query.lower()
-        scored_docs = []
-        
-        for doc in documents:
-            content_lower = doc.page_content.lower()
-            # Simple keyword scoring
-            score = sum(1 for word in query_lower.split() if word in content_lower)
-            if score > 0:
-                scored_docs.append({
-                    'content': doc.page_content[:1000] + "..." if len(doc.page_content) > 1000 else doc.page_content,
-                    'source': doc.metadata.get('source', 'unknown'),
-                    'type': 'local_guideline',
-                    'relevance_score': 0.6,  # Lower score for keyword search
-                    'keyword_score': score
-                })
-        
-        # Sort by keyword score
-        scored_docs.sort(key=lambda x: x.get('keyword_score', 0), reverse=True)
-        return scored_docs[:k]
+
+        scores = defaultdict(int)
+        for token in set(query.lower().split()):
+            for doc_idx, tf in postings.get(token, {}).items():
+                scores[doc_idx] += tf
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [
+            {
+                'content': entries[doc_idx]['content'],
+                'source': entries[doc_idx]['source'],
+                'type': 'local_guideline',
+                'relevance_score': 0.6,  # Lower score for keyword search
+                'keyword_score': score
+            }
+            for doc_idx, score in top
+        ]
     
+    _WEB_CACHE_TTL = 3600  # seconds; research results go stale slowly
+    _WEB_CACHE_MAX = 128
+
+    # Medical and academic sources queried in parallel, one Exa call each
+    _WEB_DOMAINS = ["pubmed.ncbi.nlm.nih.gov", "who.int", "cdc.gov", "mayoclinic.org", "medlineplus.gov"]
+    # Deadline on the fan-out; slow domains stop gating the whole search
+    _WEB_TIMEOUT = 8.0
+
+    def _search_one_domain(self, query: str, domain: str, num_results: int) -> List[Dict]:
+        """One Exa search restricted to a single source domain"""
+        response = self.exa_client.search_and_contents(
+            query=query,
+            num_results=num_results,
+            include_domains=[domain],
+            text=True
+        )
+        return [{
+            'content': item.text[:1000] + "..." if len(item.text) > 1000 else item.text,
+            'source': item.url,
+            'title': item.title,
+            'type': 'web_research',
+            'relevance_score': item.score if hasattr(item, 'score') else 0.6
+        } for item in response.results]
+
     def search_web_research(self, query: str, num_results: int = 2) -> List[Dict]:
         """Search web for latest medical research using Exa"""
         if not self.exa_client:
             return []
-        
+
+        # Token-normalized key so reworded but equivalent queries coalesce
+        cache_key = (" ".join(sorted(set(re.findall(r"\w+", query.lower())))), num_results)
+        cached = self._web_cache.get(cache_key)
+        if cached is not None and time.time() - cached[0] < self._WEB_CACHE_TTL:
+            return cached[1]
+
         try:
-            # Focus on medical and academic sources
-            medical_query = f"medical research {query} symptoms treatment diagnosis"
-            
-            response = self.exa_client.search_and_contents(
-                query=medical_query,
-                num_results=num_results,
-                include_domains=["pubmed.ncbi.nlm.nih.gov", "who.int", "cdc.gov", "mayoclinic.org", "medlineplus.gov"],
-                text=True
-            )
-            
+            # Send the query as-is: include_domains already scopes results
+            # to medical sources, and boilerplate padding only dilutes the
+            # dense-retrieval match on Exa's side
+            medical_query = query
+
+            # Fan out one search per domain and collect whichever answer
+            # first: latency follows the fastest sources, not the slowest
             results = []
-            for item in response.results:
-                results.append({
-                    'content': item.text[:1000] + "..." if len(item.text) > 1000 else item.text,
-                    'source': item.url,
-                    'title': item.title,
-                    'type': 'web_research',
-                    'relevance_score': item.score if hasattr(item, 'score') else 0.6
-                })
-            
+            seen_urls = set()
+            executor = ThreadPoolExecutor(max_workers=len(self._WEB_DOMAINS))
+            try:
+                futures = [
+                    executor.submit(self._search_one_domain, medical_query, domain, num_results)
+                    for domain in self._WEB_DOMAINS
+                ]
+                for future in as_completed(futures, timeout=self._WEB_TIMEOUT):
+                    try:
+                        domain_results = future.result()
+                    except Exception:
+                        continue  # one slow or failing domain must not sink the rest
+                    for item in domain_results:
+                        if item['source'] not in seen_urls:
+                            seen_urls.add(item['source'])
+                            results.append(item)
+                    if len(results) >= num_results:
+                        break
+            except FutureTimeoutError:
+                pass  # keep whatever arrived before the deadline
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            results = results[:num_results]
+
+            if len(self._web_cache) >= self._WEB_CACHE_MAX:
+                self._web_cache.pop(next(iter(self._web_cache)))
+            self._web_cache[cache_key] = (time.time(), results)
             return results
-            
+
         except Exception as e:
             st.warning(f"Web search failed: {e}")
             return []
@@ -204,16 +493,42 @@ class HybridMedicalRetriever:
         """
         Perform hybrid search combining local guidelines and web research
         """
+        # Reruns of the same turn ask the same question; skip the whole
+        # local + web + rank pipeline when nothing relevant changed
+        memo_key = (query, tuple(symptoms), tuple(c.get('name', '') for c in conditions))
+        memo = self._last_hybrid
+        if memo is not None and memo[0] == memo_key:
+            return memo[1]
+
         # Enhanced query with medical context
         enhanced_query = f"{query}. Symptoms: {', '.join(symptoms)}. Conditions: {', '.join([c.get('name', '') for c in conditions])}"
         
-        # Search local guidelines (primary source)
-        local_results = self.search_local_guidelines(enhanced_query, k=3)
-        
-        # Search web for supplementary information (if available)
-        web_results = []
-        if self.exa_client:
-            web_results = self.search_web_research(enhanced_query, num_results=2)
+        # Run the CPU-bound local search and the network-bound Exa call
+        # concurrently: wall-clock becomes max(local, web), not their sum.
+        # With symptoms, per-symptom evidence comes from one batched search.
+        def local_search():
+            if not symptoms:
+                return self.search_local_guidelines(enhanced_query, k=3)
+            per_query = self.search_local_guidelines_batch([enhanced_query] + symptoms, k=3)
+            merged = {}
+            for row in per_query:
+                for result in row:
+                    key = (result['source'], result['content'][:80])
+                    if key not in merged or result['relevance_score'] > merged[key]['relevance_score']:
+                        merged[key] = result
+            return sorted(
+                merged.values(),
+                key=lambda r: r.get('relevance_score', 0) or 0,
+                reverse=True
+            )[:3]
+
+        web_future = None
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            local_future = executor.submit(local_search)
+            if self.exa_client:
+                web_future = executor.submit(self.search_web_research, enhanced_query, 2)
+            local_results = local_future.result()
+            web_results = web_future.result() if web_future else []
         
         # Combine and rank results
         all_results = local_results + web_results
@@ -222,37 +537,44 @@ class HybridMedicalRetriever:
         # Handle None values in relevance_score
         all_results.sort(key=lambda x: x.get('relevance_score', 0) or 0, reverse=True)
         
-        return {
+        result = {
             'local_results': local_results,
             'web_results': web_results,
             'combined_results': all_results[:5],  # Top 5 results
             'total_sources': len(all_results)
         }
+        self._last_hybrid = (memo_key, result)
+        return result
     
     def get_context_for_gemini(self, search_results: Dict) -> str:
         """
         Prepare context from hybrid search results for Gemini
         """
-        context_parts = []
-        
+        sections = []
+
         # Add local guidelines context
         if search_results['local_results']:
-            context_parts.append("=== MEDICAL GUIDELINES (Primary Sources) ===")
-            for result in search_results['local_results']:
-                context_parts.append(f"Source: {result['source']}")
-                context_parts.append(f"Content: {result['content'][:500]}...")
-                context_parts.append("")
-        
+            sections.append(
+                "=== MEDICAL GUIDELINES (Primary Sources) ===\n"
+                + "\n".join(
+                    f"Source: {result['source']}\nContent: {result['content'][:500]}...\n"
+                    for result in search_results['local_results']
+                )
+            )
+
         # Add web research context
         if search_results['web_results']:
-            context_parts.append("=== LATEST MEDICAL RESEARCH (Supplementary) ===")
-            for result in search_results['web_results']:
-                context_parts.append(f"Source: {result.get('title', 'Web Source')}")
-                context_parts.append(f"URL: {result['source']}")
-                context_parts.append(f"Content: {result['content'][:300]}...")
-                context_parts.append("")
-        
-        return "\n".join(context_parts)
+            sections.append(
+                "=== LATEST MEDICAL RESEARCH (Supplementary) ===\n"
+                + "\n".join(
+                    f"Source: {result.get('title', 'Web Source')}\n"
+                    f"URL: {result['source']}\n"
+                    f"Content: {result['content'][:300]}...\n"
+                    for result in search_results['web_results']
+                )
+            )
+
+        return "\n".join(sections)
 
 # Cached instance
 @st.cache_resource